@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+'''
+Fake GitLab API v3 server of the benchmarks, serving in memory the endpoints
+called by the controller, with pagination headers, ETags and injected latency
+'''
+from __future__ import absolute_import
+
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+import traceback
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class FakeGitlabState(object):
+    """Users, groups, projects, branches and members of the fake server"""
+
+    def __init__(self, users=100, groups=10, projects=1000, branches=5):
+        """
+        :param users: number of users
+        :param groups: number of groups
+        :param projects: number of projects, spread over the groups
+        :param branches: number of branches per project
+        """
+        self.users = [{'id': number, 'username': 'user{0}'.format(number),
+                       'name': 'User {0}'.format(number), 'state': 'active',
+                       'is_admin': number == 1, 'avatar_url': ''}
+                      for number in range(1, users + 1)]
+        self.groups = [{'id': 1000 + number, 'name': 'group{0}'.format(number),
+                        'path': 'group{0}'.format(number)}
+                       for number in range(groups)]
+        self.projects = list()
+        for number in range(projects):
+            group = self.groups[number % groups]
+            self.projects.append(self.new_project(number + 1, 'project{0}'.format(number), group))
+        self.branches = dict((project['id'], ['master'] + ['branch{0}'.format(x)
+                                                            for x in range(branches - 1)])
+                             for project in self.projects)
+        self.members = dict((project['id'], []) for project in self.projects)
+        self.group_members = dict((group['id'], []) for group in self.groups)
+        self.calls = 0
+        self.latency = 0.0
+        self.lock = threading.Lock()
+
+
+    def new_project(self, project_id, name, namespace):
+        """Return a project of a namespace"""
+        return {'id': project_id, 'name': name, 'description': 'Project {0}'.format(name),
+                'path': name, 'path_with_namespace': '{0}/{1}'.format(namespace['name'], name),
+                'namespace': {'id': namespace['id'], 'name': namespace['name']},
+                'last_activity_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                'web_url': 'http://gitlab/{0}/{1}'.format(namespace['name'], name)}
+
+
+    def project(self, project_id):
+        """Return a project of an id, None if unknown"""
+        for project in self.projects:
+            if project['id'] == project_id:
+                return project
+
+
+    def project_with_path(self, path_with_namespace):
+        """Return a project of a path like mygroup/myproject, None if unknown"""
+        for project in self.projects:
+            if project['path_with_namespace'] == path_with_namespace:
+                return project
+
+
+    def user(self, user_id):
+        """Return a user of an id, None if unknown"""
+        for user in self.users:
+            if user['id'] == user_id:
+                return user
+
+
+class FakeGitlabHandler(BaseHTTPRequestHandler):
+    """Requests of the fake server"""
+
+    protocol_version = 'HTTP/1.1'
+    # Unbuffered writes would send the headers and the body in separate packets
+    wbufsize = -1
+    state = None
+
+
+    def log_message(self, *args):
+        """Do not log the requests"""
+        pass
+
+
+    def send(self, code, body, headers=None):
+        """Send a JSON response, or a 304 when the client has its ETag"""
+        data = json.dumps(body)
+        etag = 'W/"{0}"'.format(hashlib.md5(data).hexdigest())
+        if code == 200 and self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(code)
+        if code == 200:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def handle_call(self, method):
+        """Answer a call of the API"""
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        path = re.sub(r'^/api/v3', '', url.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = dict(urlparse.parse_qsl(self.rfile.read(length))) if length else {}
+        state = self.state
+        with state.lock:
+            state.calls += 1
+        if state.latency:
+            time.sleep(state.latency)
+        response = (404, {'message': '404 Not found'})
+        with state.lock:
+            for pattern, handler in ROUTES.get(method, ()):
+                match = re.match(pattern, path)
+                if match:
+                    response = handler(state, query, form, *[int(x) if x.isdigit() else x
+                                                             for x in match.groups()])
+                    break
+        self.send(*response)
+
+
+    def do_GET(self):
+        self.handle_call('GET')
+
+
+    def do_POST(self):
+        self.handle_call('POST')
+
+
+    def do_PUT(self):
+        self.handle_call('PUT')
+
+
+    def do_DELETE(self):
+        self.handle_call('DELETE')
+
+
+def _page(items, query):
+    """Return a page of a listing with the pagination headers of GitLab"""
+    page = int(query.get('page', ['1'])[0])
+    per_page = min(int(query.get('per_page', ['20'])[0]), 100)
+    if query.get('order_by') == ['last_activity_at']:
+        items = sorted(items, key=lambda x: x.get('last_activity_at', ''),
+                       reverse=query.get('sort') != ['asc'])
+    total = len(items)
+    return (200, items[(page - 1) * per_page:page * per_page],
+            {'X-Total': total, 'X-Total-Pages': (total + per_page - 1) // per_page,
+             'X-Per-Page': per_page, 'X-Page': page})
+
+
+def _add_member(state, members, user_id, access_level):
+    """Add a member to a member list"""
+    user = state.user(user_id)
+    if user is None:
+        return 404, {'message': '404 User Not Found'}
+    if [x for x in members if x['id'] == user_id]:
+        return 409, {'message': 'Already exists'}
+    member = dict(user, access_level=int(access_level))
+    members.append(member)
+    return 201, member
+
+
+def _update_member(members, user_id, access_level):
+    """Change the access level of a member"""
+    for member in members:
+        if member['id'] == user_id:
+            member['access_level'] = int(access_level)
+            return 200, member
+    return 404, {'message': '404 Not found'}
+
+
+def _remove_member(members, user_id):
+    """Remove a user from a member list"""
+    members[:] = [x for x in members if x['id'] != user_id]
+    return 200, {}
+
+
+def _project_with_path(state, query, form, path):
+    """GET /projects/:namespace%2F:name"""
+    project = state.project_with_path(urlparse.unquote(path))
+    if project is None:
+        return 404, {'message': '404 Project Not Found'}
+    return 200, project
+
+
+def _create_project(state, query, form):
+    """POST /projects, in a group or in the namespace of the sudo user"""
+    groups = [x for x in state.groups if str(x['id']) == form.get('namespace_id')]
+    namespace = groups[0] if groups else {'id': 0, 'name': query.get('sudo', ['root'])[0]}
+    project = state.new_project(max(x['id'] for x in state.projects) + 1, form['name'], namespace)
+    state.projects.append(project)
+    state.branches[project['id']] = ['master']
+    state.members[project['id']] = []
+    return 201, project
+
+
+def _fork_project(state, query, form, project_id):
+    """POST /projects/fork/:id, in the namespace of the sudo user"""
+    source = state.project(project_id)
+    if source is None:
+        return 404, {'message': '404 Project Not Found'}
+    user = query.get('sudo', ['root'])[0]
+    project = state.new_project(max(x['id'] for x in state.projects) + 1,
+                                source['name'], {'id': 0, 'name': user})
+    state.projects.append(project)
+    state.branches[project['id']] = list(state.branches[project_id])
+    state.members[project['id']] = []
+    return 201, project
+
+
+def _delete_project(state, query, form, project_id):
+    """DELETE /projects/:id"""
+    state.projects = [x for x in state.projects if x['id'] != project_id]
+    return 200, True
+
+
+def _create_branch(state, query, form, project_id):
+    """POST /projects/:id/repository/branches"""
+    state.branches[project_id].append(form['branch_name'])
+    return 201, {'name': form['branch_name']}
+
+
+def _delete_branch(state, query, form, project_id, name):
+    """DELETE /projects/:id/repository/branches/:branch"""
+    if name not in state.branches[project_id]:
+        return 404, {'message': '404 Branch Not Found'}
+    state.branches[project_id].remove(name)
+    return 200, {'branch_name': name}
+
+
+ROUTES = {
+    'GET': (
+        (r'^/user$', lambda s, q, f: (200, s.users[0])),
+        (r'^/users$', lambda s, q, f: _page(s.users, q)),
+        (r'^/groups$', lambda s, q, f: _page(s.groups, q)),
+        (r'^/groups/(\d+)/members$', lambda s, q, f, i: _page(s.group_members[i], q)),
+        (r'^/projects/all$', lambda s, q, f: _page(s.projects, q)),
+        (r'^/projects/(\d+)$', lambda s, q, f, i: (200, s.project(i))),
+        (r'^/projects/([^/]+%2F[^/]+)$', _project_with_path),
+        (r'^/projects/(\d+)/repository/branches$',
+         lambda s, q, f, i: (200, [{'name': x} for x in s.branches[i]])),
+        (r'^/projects/(\d+)/members$', lambda s, q, f, i: _page(s.members[i], q)),
+    ),
+    'POST': (
+        (r'^/projects$', _create_project),
+        (r'^/projects/fork/(\d+)$', _fork_project),
+        (r'^/projects/(\d+)/fork/(\d+)$', lambda s, q, f, i, j: (201, s.project(i))),
+        (r'^/projects/(\d+)/repository/branches$', _create_branch),
+        (r'^/projects/(\d+)/members$',
+         lambda s, q, f, i: _add_member(s, s.members[i], int(f['user_id']), f['access_level'])),
+        (r'^/groups/(\d+)/members$',
+         lambda s, q, f, i: _add_member(s, s.group_members[i], int(f['user_id']),
+                                        f['access_level'])),
+    ),
+    'PUT': (
+        (r'^/projects/(\d+)/members/(\d+)$',
+         lambda s, q, f, i, j: _update_member(s.members[i], j, f['access_level'])),
+    ),
+    'DELETE': (
+        (r'^/projects/(\d+)$', _delete_project),
+        (r'^/projects/(\d+)/repository/branches/(.+)$', _delete_branch),
+        (r'^/projects/(\d+)/members/(\d+)$', lambda s, q, f, i, j: _remove_member(s.members[i], j)),
+        (r'^/groups/(\d+)/members/(\d+)$',
+         lambda s, q, f, i, j: _remove_member(s.group_members[i], j)),
+    ),
+}
+
+
+class FakeGitlabServer(ThreadingMixIn, HTTPServer):
+    """Threaded fake server"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+    def handle_error(self, request, client_address):
+        """Report the errors on stderr, stdout carrying the JSON report"""
+        sys.stderr.write('Error of a request from {0}\n{1}'.format(client_address,
+                                                                   traceback.format_exc()))
+
+
+def start(state):
+    """Serve a state on a free local port, on a background thread
+
+    :param state: FakeGitlabState
+    :return: the server, with its url in server.url
+    """
+    class Handler(FakeGitlabHandler):
+        """Requests of the fake server, on the state"""
+        pass
+    Handler.state = state
+    server = FakeGitlabServer(('127.0.0.1', 0), Handler)
+    server.url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of the application against a fake GitLab server
+
+    python benchmarks/run.py --projects 5000 --latency 0.05
+
+Each scenario is run a number of times through the Flask test client, in a
+process of its own, and reports its upstream calls, its latency percentiles
+and the peak memory of its process.
+'''
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gitlab import FakeGitlabState, start
+
+
+def parse_args():
+    """Return the options of the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--branches', type=int, default=5, help='branches per project')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds added to each GitLab call')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10,
+                        help='projects of a user environment submission')
+    parser.add_argument('--scenario', action='append',
+                        help='scenario to run, every scenario by default')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    return parser.parse_args()
+
+
+def configure(url):
+    """Point the application at the fake server, with the state kept in memory
+    and the submissions run synchronously, before the modules read the settings"""
+    from gitlaber import config
+    config.GITLAB_URL = url
+    config.SNAPSHOT_PATH = ''
+    config.GITLAB_ADMIN_TOKEN = ''
+    config.JOBS_ENABLED = False
+    config.JOBS_STORE = 'memory'
+    config.GITLAB_RATE_LIMIT = 0
+
+
+def percentile(values, fraction):
+    """Return a percentile of a list of values"""
+    values = sorted(values)
+    return values[int(round((len(values) - 1) * fraction))]
+
+
+def peak_memory():
+    """Return the peak resident memory of the process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Scenarios(object):
+    """Requests of the scenarios, driven through the Flask test client"""
+
+    def __init__(self, client, state, options):
+        """
+        :param client: Flask test client, logged in
+        :param state: FakeGitlabState of the fake server
+        :param options: options of the command line
+        """
+        self.client = client
+        self.state = state
+        self.options = options
+
+
+    def request(self, method, url, **kwargs):
+        """Send a request and read its whole response"""
+        response = getattr(self.client, method)(url, **kwargs)
+        response.get_data()
+        if response.status_code >= 400:
+            raise RuntimeError('{0} {1}: {2}'.format(method.upper(), url, response.status_code))
+        return response
+
+
+    def index_cold(self, iteration):
+        """index() with the listings evicted from the cache, and the responses
+        evicted from the transport so that they are not revalidated"""
+        from gitlaber import controllers
+        controllers.LISTING_CACHE.clear()
+        controllers.TRANSPORT.forget_stored()
+        self.request('get', '/')
+
+
+    def index_warm(self, iteration):
+        """index() with the listings cached"""
+        self.request('get', '/')
+
+
+    def data_projects(self, iteration):
+        """/data listing the projects of a group"""
+        group = self.state.groups[iteration % len(self.state.groups)]
+        self.request('get', '/data?type=projects&path={0}'.format(group['name']))
+
+
+    def data_project_branches(self, iteration):
+        """/data listing the branches of a project"""
+        project = self.state.projects[iteration % len(self.state.projects)]
+        self.request('get', '/data?type=project_branches&path={0}'
+                     .format(project['path_with_namespace']))
+
+
+    def result_manage_project(self, iteration):
+        """/result creating a project in a group, with a member and a fork"""
+        user = self.state.users[(iteration % (len(self.state.users) - 1)) + 1]
+        group = self.state.groups[iteration % len(self.state.groups)]
+        self.request('post', '/result', data={
+            'user': '{0},{1}'.format(user['username'], user['id']),
+            'project': 'bench-{0}-{1}'.format(int(time.time()), iteration),
+            'project_group': group['name'],
+            'project_access_level': '30',
+            'project_action': 'create',
+            'import_url': 'http://git/bench.git',
+            'projects': '[]'})
+
+
+    def result_manage_user_env(self, iteration):
+        """/result creating then deleting the environment of a user on projects"""
+        user = self.state.users[(iteration % (len(self.state.users) - 1)) + 1]
+        projects = self.state.projects[:self.options.rows]
+        rows = json.dumps([{'group': project['namespace']['name'],
+                            'name': project['name'],
+                            'access': '30',
+                            'branch': 'master'} for project in projects])
+        for action in ('create', 'delete'):
+            self.request('post', '/result', data={
+                'user': '{0},{1}'.format(user['username'], user['id']),
+                'project_group': projects[0]['namespace']['name'],
+                'project_access_level': '30',
+                'import_url': 'http://git/bench.git',
+                'projects': rows,
+                'env_action': action})
+
+
+SCENARIOS = ('index_cold', 'index_warm', 'data_projects', 'data_project_branches',
+             'result_manage_project', 'result_manage_user_env')
+
+
+def run(options):
+    """Run the scenarios
+
+    :return: list of the reports of the scenarios
+    """
+    state = FakeGitlabState(options.users, options.groups, options.projects, options.branches)
+    server = start(state)
+    configure(server.url)
+
+    import main
+    application = main.create_app(production=True)
+    application.testing = True
+    client = application.test_client()
+    with client.session_transaction() as session:
+        session['access_token'] = ('benchmark', '')
+        session['is_admin'] = True
+
+    scenarios = Scenarios(client, state, options)
+    reports = list()
+    for name in options.scenario or SCENARIOS:
+        scenario = getattr(scenarios, name)
+        # Warm up the imports, the templates and the connections
+        scenario(0)
+        state.latency = options.latency
+        calls = state.calls
+        timings = list()
+        for iteration in range(1, options.iterations + 1):
+            start_time = time.time()
+            scenario(iteration)
+            timings.append(time.time() - start_time)
+        state.latency = 0.0
+        reports.append({'scenario': name,
+                        'iterations': options.iterations,
+                        'upstream_calls': (state.calls - calls) / float(options.iterations),
+                        'p50': percentile(timings, 0.5),
+                        'p90': percentile(timings, 0.9),
+                        'p99': percentile(timings, 0.99),
+                        'max': max(timings),
+                        'peak_memory_mb': peak_memory()})
+    from gitlaber import controllers
+    # Close the kept-alive connections before the server, their handler
+    # threads would otherwise die with the interpreter, printing tracebacks
+    controllers.TRANSPORT.session.close()
+    server.shutdown()
+    return reports
+
+
+def run_isolated(options):
+    """Run each scenario in a new process, so that the peak memory reported
+    is the one of the scenario rather than of the scenarios run before it
+
+    :return: list of the reports of the scenarios
+    """
+    reports = list()
+    for name in options.scenario or SCENARIOS:
+        command = [sys.executable, os.path.abspath(__file__), '--json', '--scenario', name]
+        for option in ('users', 'groups', 'projects', 'branches', 'latency',
+                       'iterations', 'rows'):
+            command += ['--{0}'.format(option), str(getattr(options, option))]
+        reports.extend(json.loads(subprocess.check_output(command)))
+    return reports
+
+
+def main():
+    """Run the benchmarks and print their report"""
+    options = parse_args()
+    if len(options.scenario or SCENARIOS) > 1:
+        reports = run_isolated(options)
+    else:
+        reports = run(options)
+    if options.json:
+        sys.stdout.write(json.dumps(reports, indent=4) + '\n')
+        return
+    sys.stdout.write('{0:<24} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8} {6:>10}\n'.format(
+        'scenario', 'calls', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'peak MB'))
+    for report in reports:
+        sys.stdout.write('{0:<24} {1:>8.1f} {2:>8.1f} {3:>8.1f} {4:>8.1f} {5:>8.1f} {6:>10.1f}\n'
+                         .format(report['scenario'], report['upstream_calls'],
+                                 report['p50'] * 1000, report['p90'] * 1000,
+                                 report['p99'] * 1000, report['max'] * 1000,
+                                 report['peak_memory_mb']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Offline build of the static assets
+
+    python build_assets.py
+
+Compiles and minifies scss/00_main.scss, minifies the scripts of js/, and
+writes them with the stylesheets of css/ under static/dist with their content
+hash in their name, along with their gzip (and brotli, when the brotli module
+is installed) variants and the manifest.json mapping their names.
+'''
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+
+import cssmin
+import jsmin
+from scss.compiler import compile_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from gitlaber import config
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gitlaber', 'static')
+
+
+def read(path):
+    """Return the content of a static file"""
+    with open(os.path.join(STATIC_FOLDER, path), 'rb') as asset:
+        return asset.read()
+
+
+def sources():
+    """Yield the name and the built content of each asset"""
+    css = cssmin.cssmin(compile_file(os.path.join(STATIC_FOLDER, 'scss', '00_main.scss')))
+    yield 'css/main.css', css.encode('utf-8')
+    for folder, extension in (('css', '.css'), ('js', '.js')):
+        for filename in sorted(os.listdir(os.path.join(STATIC_FOLDER, folder))):
+            name = '{0}/{1}'.format(folder, filename)
+            if not filename.endswith(extension) or name == 'css/main.css':
+                continue
+            content = read(name)
+            if extension == '.js' and not filename.endswith('.min.js'):
+                content = jsmin.jsmin(content)
+            yield name, content
+
+
+def write(path, content):
+    """Write a file of the dist folder, with its precompressed variants"""
+    with open(path, 'wb') as asset:
+        asset.write(content)
+    with open(path + '.gz', 'wb') as raw:
+        # No file name nor time in the header, so that builds are reproducible
+        compressed = gzip.GzipFile('', 'wb', 9, raw, mtime=0)
+        compressed.write(content)
+        compressed.close()
+    if brotli is not None:
+        with open(path + '.br', 'wb') as asset:
+            asset.write(brotli.compress(content))
+
+
+def build():
+    """Build the assets and their manifest in the dist folder
+
+    :return: the manifest, mapping each asset name to its fingerprinted name
+    """
+    dist = os.path.join(STATIC_FOLDER, config.ASSETS_DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+    manifest = dict()
+    for name, content in sources():
+        # dist is a sibling of css/ and js/, relative urls like ../fonts still resolve
+        root, extension = os.path.splitext(os.path.basename(name))
+        filename = '{0}.{1}{2}'.format(root, hashlib.md5(content).hexdigest()[:12], extension)
+        write(os.path.join(dist, filename), content)
+        manifest[name] = '{0}/{1}'.format(config.ASSETS_DIST, filename)
+    with open(os.path.join(dist, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    for name, filename in sorted(build().items()):
+        sys.stdout.write('{0} -> {1}\n'.format(name, filename))
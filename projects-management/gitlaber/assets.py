@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+Flask assets
+'''
+
+from __future__ import absolute_import
+
+import os
+import json
+import mimetypes
+
+# Precompressed variants, by order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class AssetManifest(object):
+    """Fingerprinted names of the assets written by build_assets.py"""
+
+    def __init__(self, static_folder, dist):
+        """
+        :param static_folder: static folder of the application
+        :param dist: folder of the built assets, relative to the static folder
+        """
+        self.folder = os.path.join(static_folder, dist)
+        path = os.path.join(self.folder, 'manifest.json')
+        self.names = dict()
+        if os.path.exists(path):
+            with open(path) as manifest:
+                self.names = json.load(manifest)
+
+
+    def __nonzero__(self):
+        """Tell if the assets were built"""
+        return bool(self.names)
+
+
+    def filename(self, name):
+        """Return the built name of an asset relative to the static folder,
+        the name itself if it was not built
+
+        :param name: name of the asset, like 'css/main.css'
+        """
+        return self.names.get(name, name)
+
+
+    def variant(self, filename, accept_encoding):
+        """Return the file to send for a built asset, and its content encoding
+
+        :param filename: name of the file relative to the dist folder
+        :param accept_encoding: Accept-Encoding header of the request
+        :return: the file name relative to the dist folder, and the encoding
+        (None for the uncompressed file)
+        """
+        accepted = [x.split(';')[0].strip() for x in (accept_encoding or '').split(',')]
+        for encoding, extension in ENCODINGS:
+            if encoding in accepted and os.path.isfile(os.path.join(self.folder,
+                                                                    filename + extension)):
+                return filename + extension, encoding
+        return filename, None
+
+
+    @staticmethod
+    def mimetype(filename):
+        """Return the mimetype of an asset"""
+        return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+Flask async client
+'''
+
+from __future__ import absolute_import
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gitlaber import config
+
+EXECUTOR = ThreadPoolExecutor(max_workers=config.ASYNC_WORKERS)
+
+
+def gather(*futures, **kwargs):
+    """Wait for futures from synchronous code, like the Flask views
+
+    :param *futures: futures returned by AsyncGitlab
+    :param timeout: maximum seconds to wait for each result
+    :return: the list of their results, raising the first error
+    """
+    timeout = kwargs.pop('timeout', None)
+    return [future.result(timeout) for future in futures]
+
+
+class AsyncGitlab(object):
+    """Non-blocking facade of a Gitlab client: calls run on a pool of threads
+    shared by the process, sharing its connection pool, and return futures"""
+
+    def __init__(self, gitlab, executor=EXECUTOR, max_pending=None):
+        """
+        :param gitlab: Gitlab client doing the calls
+        :param executor: pool of threads running the calls
+        :param max_pending: number of calls submitted and not finished, beyond
+        which the callers wait (default is ASYNC_MAX_PENDING)
+        """
+        self.gitlab = gitlab
+        self.executor = executor
+        self.semaphore = threading.BoundedSemaphore(max_pending or config.ASYNC_MAX_PENDING)
+
+
+    def submit(self, function, *args, **kwargs):
+        """Run a function of the Gitlab client with the token of the calling thread
+
+        :param function: method of the Gitlab client
+        :return: the future of its result
+        """
+        self.semaphore.acquire()
+        try:
+            future = self.executor.submit(self.gitlab.bind(function), *args, **kwargs)
+        except Exception:
+            self.semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self.semaphore.release())
+        return future
+
+
+    def get(self, path):
+        """Future of Gitlab.get"""
+        return self.submit(self.gitlab.get, path)
+
+
+    def post(self, path, params=None):
+        """Future of Gitlab.post"""
+        return self.submit(self.gitlab.post, path, params)
+
+
+    def put(self, path, params):
+        """Future of Gitlab.put"""
+        return self.submit(self.gitlab.put, path, params)
+
+
+    def delete(self, path):
+        """Future of Gitlab.delete"""
+        return self.submit(self.gitlab.delete, path)
+
+
+    def get_paginated_resources(self, rpath, page=1, per_page=None, params=None, project=False):
+        """Future of Gitlab.get_paginated_resources"""
+        return self.submit(self.gitlab.get_paginated_resources, rpath, page, per_page, params,
+                           project)
+
+
+    def getall(self, rpath, page=1, **kwargs):
+        """Yield the items of every page of a resource from the first one. Once
+        the first page announces the page count, the other pages are all
+        requested at once and yielded in order as they arrive.
+
+        :param rpath: Relative resource path, like '/users'
+        :param page: Page number to start at
+        :param **kwargs: per_page, params and project of get_paginated_resources
+        """
+        results = self.get_paginated_resources(rpath, page, **kwargs).result()
+        last_page = getattr(results, 'total_pages', None)
+        while results:
+            for result in results:
+                yield result
+            if last_page is not None:
+                break
+            page += 1
+            results = self.get_paginated_resources(rpath, page, **kwargs).result()
+        if not results or last_page is None or last_page <= page:
+            return
+        pages = [self.get_paginated_resources(rpath, number, **kwargs)
+                 for number in range(page + 1, last_page + 1)]
+        for future in pages:
+            for result in future.result():
+                yield result
+
+
+    def get_listing(self, rpath):
+        """Future of Gitlab.get_listing"""
+        return self.submit(self.gitlab.get_listing, rpath)
+
+
+    def get_project_branches(self, path_with_namespace):
+        """Future of Gitlab.get_project_branches"""
+        return self.submit(self.gitlab.get_project_branches, path_with_namespace)
+
+
+    def get_member_group(self, group_name, username):
+        """Future of Gitlab.get_member_group"""
+        return self.submit(self.gitlab.get_member_group, group_name, username)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+'''
+Flask batch
+'''
+
+from __future__ import absolute_import
+
+from multiprocessing.pool import ThreadPool
+
+from gitlaber.index import MembershipIndex
+
+
+class Batch(object):
+    """Run the tasks of a submission on a bounded pool of threads,
+    sharing the group and project members they have in common"""
+
+    def __init__(self, gitlab, workers, members_max_age=None):
+        """
+        :param gitlab: Gitlab client used by the tasks
+        :param workers: number of tasks run concurrently
+        :param members_max_age: seconds the members stored in the snapshot
+        store are used, see Gitlab.read_members
+        """
+        self.gitlab = gitlab
+        self.workers = workers
+        self.members = MembershipIndex(
+            lambda source, source_id: gitlab.read_members(source, source_id, members_max_age))
+
+
+    def map(self, function, items):
+        """Apply a function on each item concurrently
+
+        :param function: function to apply
+        :param items: list of items
+        :return: list of the results, in the order of the items
+        """
+        if self.workers <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(self.gitlab.bind(function), items, chunksize=1)
+        finally:
+            pool.terminate()
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+'''
+Flask cache
+'''
+
+from __future__ import absolute_import
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class SharedStream(object):
+    """Items of a value being loaded, yielded to every caller iterating it as
+    they arrive, whatever the pace of the other callers"""
+
+    def __init__(self):
+        self._items = list()
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+
+    def append(self, item):
+        """Add an item, waking up the waiting callers"""
+        with self._condition:
+            self._items.append(item)
+            self._condition.notify_all()
+
+
+    def close(self, error=None):
+        """Mark the end of the items
+
+        :param error: exception raised to the callers after the last item, when
+        the load failed
+        """
+        with self._condition:
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+
+
+    def __iter__(self):
+        """Yield every item, from the first one, waiting for the next ones
+        outside of the lock"""
+        index = 0
+        while True:
+            with self._condition:
+                while index == len(self._items) and not self._done:
+                    self._condition.wait()
+                chunk = self._items[index:]
+                done, error = self._done, self._error
+            index += len(chunk)
+            for item in chunk:
+                yield item
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class ListingCache(object):
+    """TTL cache with LRU eviction, shared by every Gitlab client of the process"""
+
+    def __init__(self, ttl=300, max_entries=64, stale_ttl=0, stats_key=None):
+        """
+        :param ttl: seconds before an entry expires (None never expires)
+        :param max_entries: number of entries kept before evicting the least recently used
+        :param stale_ttl: seconds an expired entry is still served while it is reloaded
+        :param stats_key: name the stats of every key are counted under, for caches
+        of many keys (default is one count per key)
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stats_key = stats_key
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.RLock()
+        self._loading = {}
+        self._streams = {}
+
+
+    def _stat(self, key):
+        """Return the stats counters of a key"""
+        return self._stats.setdefault(self.stats_key or key, {'hits': 0,
+                                            'misses': 0,
+                                            'stale_hits': 0,
+                                            'evictions': 0,
+                                            'invalidations': 0})
+
+
+    def _is_fresh(self, created):
+        """Tell if an entry created at the given time is still valid"""
+        return self.ttl is None or time.time() - created < self.ttl
+
+
+    def _is_servable(self, created):
+        """Tell if an entry created at the given time is fresh, or stale but still served"""
+        return self.ttl is None or time.time() - created < self.ttl + self.stale_ttl
+
+
+    def get(self, key):
+        """Return the cached value of a key, None if missing or expired
+        past the stale delay
+
+        :param key: cache key, like '/projects/all'
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_servable(entry[1]):
+                self._entries.pop(key)
+                self._entries[key] = entry
+                if self._is_fresh(entry[1]):
+                    self._stat(key)['hits'] += 1
+                else:
+                    self._stat(key)['stale_hits'] += 1
+                return entry[0]
+            self._stat(key)['misses'] += 1
+            return None
+
+
+    def set(self, key, value, created=None):
+        """Store a value, evicting the least recently used entries when full
+
+        :param key: cache key
+        :param value: value to store
+        :param created: time the value was loaded (default is now)
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, created or time.time())
+            while len(self._entries) > self.max_entries:
+                evicted = self._entries.popitem(last=False)[0]
+                self._stat(evicted)['evictions'] += 1
+                self._loading.pop(evicted, None)
+
+
+    def contains(self, key):
+        """Tell if a key has a fresh or stale value, without counting a hit or a miss
+
+        :param key: cache key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._is_servable(entry[1])
+
+
+    def get_or_load(self, key, loader):
+        """Return the cached value of a key, or load and store it.
+        Concurrent callers missing the same key wait for a single load.
+        A stale value is returned at once while a thread reloads it.
+
+        :param key: cache key
+        :param loader: callable returning the value to store
+        :return: the cached or loaded value
+        """
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+            entry = self._entries.get(key)
+            stale = entry is not None and not self._is_fresh(entry[1])
+
+        value = self.get(key)
+        if value is not None:
+            if stale and key_lock.acquire(False):
+                thread = threading.Thread(target=self._reload, args=(key, loader, key_lock))
+                thread.daemon = True
+                thread.start()
+            return value
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_fresh(entry[1]):
+                    return entry[0]
+            value = loader()
+            self.set(key, value)
+            return value
+
+
+    def iter_or_load(self, key, loader, produce):
+        """Yield the items of the cached value of a key, like get_or_load.
+        On a miss, a thread runs the load and the callers streaming the key
+        yield its items as they arrive, then the value is stored. The key is
+        locked during the load only, never while the callers consume the items.
+
+        :param key: cache key
+        :param loader: callable returning the value to store, for the reloads
+        of a stale value and the callers missing the key while it is loaded
+        :param produce: callable taking a function to call with each item as it
+        arrives, and returning the value to store
+        """
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+            stream = self._streams.get(key)
+            servable = self.contains(key)
+        if stream is None and not servable and key_lock.acquire(False):
+            with self._lock:
+                # Another caller may have loaded the key since
+                entry = self._entries.get(key)
+                if entry is None or not self._is_fresh(entry[1]):
+                    stream = self._streams[key] = SharedStream()
+            if stream is None:
+                key_lock.release()
+            else:
+                thread = threading.Thread(target=self._produce,
+                                          args=(key, produce, stream, key_lock))
+                thread.daemon = True
+                thread.start()
+
+        if stream is None:
+            for item in self.get_or_load(key, loader):
+                yield item
+            return
+        with self._lock:
+            self._stat(key)['misses'] += 1
+        for item in stream:
+            yield item
+
+
+    def _produce(self, key, produce, stream, key_lock):
+        """Load and store a value, sharing its items as they arrive with the
+        callers streaming it, and releasing the lock of its key"""
+        try:
+            value = produce(stream.append)
+            with self._lock:
+                self.set(key, value)
+                self._streams.pop(key, None)
+            stream.close()
+        except Exception as error:
+            with self._lock:
+                self._streams.pop(key, None)
+            stream.close(error)
+        finally:
+            key_lock.release()
+
+
+    def _reload(self, key, loader, key_lock):
+        """Load and store a stale value, releasing the lock of its key"""
+        try:
+            self.set(key, loader())
+        except Exception:
+            pass
+        finally:
+            key_lock.release()
+
+
+    def update(self, key, function):
+        """Replace a cached value by the result of a function applied on it,
+        keeping its creation time. Missing keys, or expired past the stale delay,
+        are left untouched.
+
+        :param key: cache key
+        :param function: callable taking the cached value and returning the new one
+        :return: the new value, None if the key was not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_servable(entry[1]):
+                return None
+            value = function(entry[0])
+            self._entries[key] = (value, entry[1])
+            return value
+
+
+    def invalidate(self, key):
+        """Drop a key from the cache
+
+        :param key: cache key
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stat(key)['invalidations'] += 1
+
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            for key in list(self._entries):
+                self.invalidate(key)
+
+
+    def stats(self):
+        """Return the hits, misses and age of each resource, or the hits, misses
+        and number of entries of the stats key
+
+        :return: dictionary of stats by key
+        """
+        now = time.time()
+        with self._lock:
+            result = dict()
+            for key, counters in self._stats.items():
+                stat = dict(counters)
+                if self.stats_key:
+                    stat['entries'] = len(self._entries)
+                    stat['age'] = None
+                else:
+                    entry = self._entries.get(key)
+                    stat['age'] = round(now - entry[1], 1) if entry else None
+                result[key] = stat
+            return result
@@ -6,3 +6,109 @@ SECRET_KEY = 'your-secret-key'
 GITLAB_URL = 'http://my-gitlab'
 GITLAB_APP_ID = 'my-app-id'
 GITLAB_APP_SECRET = 'my-app-secret'
+
+# Cache of the users, groups and projects listings
+CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 64
+# Seconds an expired listing is still served while it is crawled again
+CACHE_STALE_TTL = 600
+
+# Background refresh of the listings with the OAuth token of an admin user,
+# every WARMER_INTERVAL seconds plus up to WARMER_JITTER seconds. The warmer
+# only runs when GITLAB_ADMIN_TOKEN is set, in the worker process holding
+# the WARMER_LOCK_PATH file lock ('' runs it in every process)
+WARMER_ENABLED = True
+WARMER_INTERVAL = 240
+WARMER_JITTER = 30
+WARMER_LOCK_PATH = 'gitlaber.warmer.lock'
+WARMER_LISTINGS = ('/users', '/groups', '/projects/all')
+GITLAB_ADMIN_TOKEN = ''
+
+# The warmer syncs the project listing incrementally, fetching the projects
+# by last activity down to the last sync, with a full crawl every
+# PROJECT_SYNC_FULL_INTERVAL seconds to drop the deleted projects
+PROJECT_SYNC_INCREMENTAL = True
+PROJECT_SYNC_FULL_INTERVAL = 3600
+
+# SQLite snapshot of the listings, branches and members, shared by the
+# worker processes of a host and loaded on startup ('' disables it)
+SNAPSHOT_PATH = 'gitlaber.db'
+
+# Branches of each project, kept in memory and in the snapshot for
+# BRANCH_CACHE_TTL seconds. The push and system hooks of GitLab, sent to
+# /hooks/gitlab with the GITLAB_WEBHOOK_TOKEN secret token ('' disables the
+# endpoint), keep them up to date and allow a much longer BRANCH_CACHE_TTL.
+# Workers sharing a snapshot pick up the hooks received by the others
+# within BRANCH_EVENTS_INTERVAL seconds
+BRANCH_CACHE_TTL = 60
+BRANCH_CACHE_MAX_ENTRIES = 5000
+GITLAB_WEBHOOK_TOKEN = ''
+BRANCH_EVENTS_INTERVAL = 2
+
+# Seconds the members of the groups and projects stored in the snapshot are
+# used by the submissions. The writes of this application drop them, the
+# changes made in GitLab are seen after this delay (0 always reads GitLab)
+MEMBERS_SNAPSHOT_TTL = 60
+
+# Number of listing pages fetched concurrently
+GITLAB_PAGE_WORKERS = 8
+
+# Number of items per listing page. In adaptive mode the largest page size
+# accepted by the server is used, up to GITLAB_MAX_PER_PAGE
+GITLAB_PER_PAGE = 20
+GITLAB_MAX_PER_PAGE = 100
+GITLAB_ADAPTIVE_PER_PAGE = True
+
+# HTTP connection pool to GitLab: number of host pools, connections kept
+# per host, keep-alive, and connect/read timeouts in seconds
+GITLAB_POOL_CONNECTIONS = 4
+GITLAB_POOL_MAXSIZE = 16
+GITLAB_KEEP_ALIVE = True
+GITLAB_CONNECT_TIMEOUT = 5
+GITLAB_READ_TIMEOUT = 60
+
+# Calls per second to GitLab shared by the threads of a process, with bursts
+# of GITLAB_RATE_BURST calls (0 disables the limit)
+GITLAB_RATE_LIMIT = 20
+GITLAB_RATE_BURST = 40
+
+# Retries of the calls failing with 429, 502, 503, 504 or a connection error,
+# after a jittered exponential backoff or the Retry-After delay. POST calls
+# are only retried on 429 and connect timeouts, never processed twice
+GITLAB_RETRIES = 3
+GITLAB_RETRY_BASE_DELAY = 0.5
+GITLAB_RETRY_MAX_DELAY = 30
+
+# Number of GET responses kept to revalidate them with ETag/Last-Modified
+# conditional requests (0 disables conditional requests)
+GITLAB_CONDITIONAL_ENTRIES = 1024
+
+# Threads of the non-blocking Gitlab client, and number of its calls
+# submitted and not finished beyond which the callers wait
+ASYNC_WORKERS = 16
+ASYNC_MAX_PENDING = 64
+
+# Number of projects managed concurrently by a user environment submission
+BATCH_WORKERS = 8
+
+# Background jobs running the /result submissions. JOBS_STORE is the path of
+# a SQLite database shared by the worker processes of a host, or 'memory' for
+# a single process: the jobs are polled from any worker
+JOBS_ENABLED = True
+JOBS_WORKERS = 4
+JOBS_STORE = 'gitlaber.jobs.db'
+JOBS_TTL = 3600
+
+# Add a X-Gitlab-Calls header reporting the upstream calls of each request,
+# flagged partial for the streamed pages, whose headers are sent first
+GITLAB_CALLS_HEADER = True
+
+# Stream the index page while the listings are crawled, flushing every
+# INDEX_STREAM_BUFFER template chunks
+INDEX_STREAMING = True
+INDEX_STREAM_BUFFER = 50
+
+# Folder of the assets built by build_assets.py, in the static folder, and
+# seconds they are cached by the clients
+ASSETS_DIST = 'dist'
+ASSETS_MAX_AGE = 31536000
@@ -6,14 +6,98 @@ Flask controller
 from __future__ import absolute_import
 
 import os
+import re
 import json
-
+import time
+import threading
+from urllib import quote, unquote
+from functools import wraps
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import requests
+from flask import g, has_app_context
 from flask_oauthlib.client import OAuth
 
 from gitlaber import config
+from gitlaber import hooks
+from gitlaber import metrics
+from gitlaber import records
+from gitlaber.batch import Batch
+from gitlaber.cache import ListingCache
+from gitlaber.index import MembershipIndex, NamespaceIndex, PrefixIndex
+from gitlaber.jobs import OperationLog
+from gitlaber.ratelimit import TokenBucket, retry_after, backoff
+from gitlaber.snapshot import SnapshotStore
+from gitlaber.transport import PooledTransport
 
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
+LISTING_CACHE = ListingCache(ttl=config.CACHE_TTL,
+                             max_entries=config.CACHE_MAX_ENTRIES,
+                             stale_ttl=config.CACHE_STALE_TTL)
+BRANCH_CACHE = ListingCache(ttl=config.BRANCH_CACHE_TTL,
+                            max_entries=config.BRANCH_CACHE_MAX_ENTRIES,
+                            stats_key='branches')
+NAMESPACE_INDEX = NamespaceIndex()
+SNAPSHOT = SnapshotStore(config.SNAPSHOT_PATH) if config.SNAPSHOT_PATH else None
+TRANSPORT = PooledTransport(pool_connections=config.GITLAB_POOL_CONNECTIONS,
+                            pool_maxsize=config.GITLAB_POOL_MAXSIZE,
+                            keep_alive=config.GITLAB_KEEP_ALIVE,
+                            connect_timeout=config.GITLAB_CONNECT_TIMEOUT,
+                            read_timeout=config.GITLAB_READ_TIMEOUT,
+                            conditional_entries=config.GITLAB_CONDITIONAL_ENTRIES)
+
+RATE_LIMITER = TokenBucket(config.GITLAB_RATE_LIMIT, config.GITLAB_RATE_BURST)
+
+# Statuses of the transient errors retried, for the idempotent methods and
+# for POST, which is only retried when the server refused to process it
+RETRY_STATUSES = {'GET': (429, 502, 503, 504),
+                  'PUT': (429, 502, 503, 504),
+                  'DELETE': (429, 502, 503, 504),
+                  'POST': (429,)}
+
+# Searchable strings of the listings, and their prefix indexes
+SEARCH_KEYS = {
+    '/users': lambda user: (user['name'], user['username']),
+    '/groups': lambda group: (group['name'],),
+    '/projects/all': lambda project: (project['name'], project['path_with_namespace']),
+}
+SEARCH_INDEXES = {}
+SEARCH_LOCK = threading.Lock()
+
+# Page size learned from the server, and page requests made and saved by it
+PAGINATION_STATS = {'per_page': None, 'requests': 0, 'requests_saved': 0}
+PAGINATION_LOCK = threading.Lock()
+
+# Last activity date of the synced projects, time of the last full crawl,
+# and outcome of the last sync of the project listing
+PROJECT_SYNC = {'watermark': None, 'last_full': None, 'last_sync': None,
+                'mode': None, 'changed': None, 'duration': None}
+PROJECT_SYNC_LOCK = threading.Lock()
+
+# Write paths which change a cached listing, the listing, and whether it is
+# patched with the returned object, or with the object fetched again
+LISTING_WRITES = (
+    (re.compile(r'^/users(/(?P<id>\d+))?$'), '/users', 'patch'),
+    (re.compile(r'^/groups(/(?P<id>\d+))?$'), '/groups', 'patch'),
+    (re.compile(r'^/projects(/(?P<id>\d+)|/fork/\d+)?$'), '/projects/all', 'patch'),
+    (re.compile(r'^/projects/(?P<id>\d+)/fork/\d+$'), '/projects/all', 'refetch'),
+)
+
+# Time the branch events of the other processes were last read, and time
+# of the last one seen
+BRANCH_EVENTS = {'checked': 0, 'seen': time.time()}
+BRANCH_EVENTS_LOCK = threading.Lock()
+
+# Write paths which change the cached branches, or the stored members of a
+# project or group
+SNAPSHOT_WRITES = (
+    (re.compile(r'^/projects/(?P<id>\d+)/repository/branches(/(?P<name>.+))?$'), 'branches'),
+    (re.compile(r'^/projects/(?P<id>\d+)/members(/\d+)?$'), 'project'),
+    (re.compile(r'^/groups/(?P<id>\d+)/members(/\d+)?$'), 'group'),
+)
+
 def _raise_error_from_response(response):
     """
     Tries to parse error message from response and raises error.
@@ -25,21 +109,127 @@ def _raise_error_from_response(response):
     raise StandardError(message)
 
 
-def find_element_in_list(list_element, search_element, match_element):
-    """Return the position of an element in a dictionnary list
+def _int_header(headers, name):
+    """Return the integer value of a response header, None if missing"""
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
 
-    :param list_element: the dictionnary list
-    :param search_element: the value of searched element
-    :param match_element: the searched key
-    :return: the position of searched element
-    """
 
-    try:
-        for element in list_element:
-            if getattr(element, match_element, None) == search_element:
-                return list_element.index(element)
-    except ValueError:
-        pass
+class Page(list):
+    """Items of a paginated resource page, with the pagination headers of its response"""
+
+    def __init__(self, items, headers=None, per_page=None):
+        """
+        :param items: items of the page
+        :param headers: response headers
+        :param per_page: number of items requested per page
+        """
+        super(Page, self).__init__(items)
+        headers = headers or {}
+        self.total = _int_header(headers, 'X-Total')
+        self.per_page = _int_header(headers, 'X-Per-Page') or per_page
+        self.total_pages = _int_header(headers, 'X-Total-Pages')
+        if self.total_pages is None and self.total is not None and self.per_page:
+            self.total_pages = (self.total + self.per_page - 1) // self.per_page
+
+
+class RequestCalls(object):
+    """Upstream calls made for a Flask request, with its GET responses
+    so that identical GETs within the request run once"""
+
+    def __init__(self):
+        self.upstream = 0
+        self.deduplicated = 0
+        self.wait = 0.0
+        self._responses = {}
+        self._lock = threading.Lock()
+
+
+    def lookup(self, key):
+        """Return whether a GET was already done, and its response
+
+        :param key: key of the GET request
+        """
+        with self._lock:
+            if key in self._responses:
+                self.deduplicated += 1
+                metrics.DEDUPLICATED_CALLS.inc()
+                return True, self._responses[key]
+            return False, None
+
+
+    def record(self, key=None, response=None):
+        """Count an upstream call, and keep the response of a GET
+
+        :param key: key of the GET request, None for writes
+        :param response: response of the GET request
+        """
+        with self._lock:
+            self.upstream += 1
+            if key is not None:
+                self._responses[key] = response
+
+
+    def forget(self):
+        """Forget the GET responses, after a write changed the remote state"""
+        with self._lock:
+            self._responses.clear()
+
+
+    def add_wait(self, seconds):
+        """Add time spent waiting on GitLab"""
+        with self._lock:
+            self.wait += seconds
+
+
+@metrics.REGISTRY.collector
+def collect_metrics():
+    """Return the listing cache, pagination and connection pool stats as gauges"""
+    cache_stats = LISTING_CACHE.stats()
+    cache_stats.update(BRANCH_CACHE.stats())
+    pool_stats = TRANSPORT.stats()
+    revalidation_stats = TRANSPORT.revalidation_stats()
+    gauges = list()
+    for name in ('hits', 'misses', 'evictions', 'invalidations', 'age'):
+        gauges.append(('gitlab_listing_cache_{0}'.format(name),
+                       'Listing cache {0} by resource'.format(name),
+                       [({'resource': key}, stat[name]) for key, stat in cache_stats.items()]))
+    gauges.append(('gitlab_pagination_requests', 'Listing page requests',
+                   [({}, PAGINATION_STATS['requests'])]))
+    gauges.append(('gitlab_pagination_requests_saved',
+                   'Listing page requests saved by the adaptive page size',
+                   [({}, PAGINATION_STATS['requests_saved'])]))
+    for name in ('created', 'idle', 'requests', 'reused'):
+        gauges.append(('gitlab_pool_connections_{0}'.format(name),
+                       'Connection pool {0} by host'.format(name),
+                       [({'host': host}, stat[name]) for host, stat in pool_stats['hosts'].items()]))
+    gauges.append(('gitlab_pool_connections_open', 'Open connections to GitLab',
+                   [({}, pool_stats['open'])]))
+    for name in ('hits', 'misses', 'entries'):
+        gauges.append(('gitlab_revalidation_{0}'.format(name),
+                       'Conditional requests {0}'.format(name),
+                       [({}, revalidation_stats[name])]))
+    return gauges
+
+
+def restore_snapshot():
+    """Fill the listing cache and the namespace index from the snapshot store,
+    so that a freshly started process serves the pages without crawling"""
+    if SNAPSHOT is None:
+        return
+    max_age = config.CACHE_TTL + config.CACHE_STALE_TTL if config.CACHE_TTL else None
+    for rpath in ('/users', '/groups', '/projects/all'):
+        stored = SNAPSHOT.load_listing(rpath, max_age)
+        if stored is None:
+            continue
+        items, updated = stored
+        LISTING_CACHE.set(rpath, items, created=updated)
+        if rpath == '/projects/all':
+            NAMESPACE_INDEX.sync_projects(items)
+        elif rpath == '/groups':
+            NAMESPACE_INDEX.sync_groups(items)
 
 
 class Gitlab(object):
@@ -51,9 +241,15 @@ class Gitlab(object):
         :param session: session
         """
         def get_gitlab_token():
-            """Return session token"""
+            """Return the token bound to the current thread, or the session token"""
+            token = getattr(self._local, 'token', None)
+            if token is not None:
+                return token
             return session.get('access_token')
 
+        self._local = threading.local()
+        self._get_token = get_gitlab_token
+
         self.oauth = OAuth()
         self.auth = self.oauth.remote_app(
             'gitlab',
@@ -65,39 +261,203 @@ class Gitlab(object):
             content_type='application/json'
         )
         self.auth.tokengetter(get_gitlab_token)
+        self.auth.http_request = self.http_request
+        self.transport = TRANSPORT
+        self.limiter = RATE_LIMITER
         self._url = '{0}/api/v3'.format(self.auth.base_url)
+        self.cache = LISTING_CACHE
+        self.branches = BRANCH_CACHE
+        self.index = NAMESPACE_INDEX
+        self.snapshot = SNAPSHOT
+
 
+    def bind(self, function):
+        """Wrap a function to run it with the token of the calling thread,
+        so that worker threads outside of the request context can call the API
 
-    @staticmethod
-    def getall(method, *args, **kwargs):
+        :param function: function to wrap
+        :return: the wrapped function
+        """
+        token = self._get_token()
+        calls = self.request_calls()
+
+        @wraps(function)
+        def bound(*args, **kwargs):
+            """Run the function with the bound token"""
+            previous = getattr(self._local, 'token', None), getattr(self._local, 'calls', None)
+            self._local.token, self._local.calls = token, calls
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._local.token, self._local.calls = previous
+        return bound
+
+
+    def http_request(self, uri, headers=None, data=None, method=None):
+        """Send a request of the OAuth remote app through the rate limiter and
+        the pooled transport, retrying the transient errors with a jittered
+        exponential backoff, or after the delay asked by the server
+
+        :return: the response and its content
+        """
+        method = method or ('POST' if data else 'GET')
+        route = metrics.route_template(uri)
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire()
+            if waited:
+                metrics.RATE_LIMIT_WAIT.observe(waited)
+            try:
+                response, content = self._send(uri, headers, data, method)
+            except requests.exceptions.ConnectTimeout as error:
+                # Nothing was sent, every method can be retried
+                reason, response = 'connect_timeout', None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if method == 'POST':
+                    raise
+                reason, response = 'connection', None
+            else:
+                if response.code not in RETRY_STATUSES.get(method, ()):
+                    return response, content
+                reason = str(response.code)
+
+            attempt += 1
+            if attempt > config.GITLAB_RETRIES:
+                if response is None:
+                    raise error
+                return response, content
+            delay = retry_after(response.headers) if response is not None else None
+            if delay is None:
+                delay = backoff(attempt, config.GITLAB_RETRY_BASE_DELAY,
+                                config.GITLAB_RETRY_MAX_DELAY)
+            else:
+                delay = min(delay, config.GITLAB_RETRY_MAX_DELAY)
+                if response.code == 429:
+                    # The limit is the server's, hold the other threads too
+                    self.limiter.pause(delay)
+            metrics.RETRIES.inc(method=method, route=route, reason=reason)
+            time.sleep(delay)
+
+
+    def _send(self, uri, headers=None, data=None, method=None):
+        """Send a request through the pooled transport,
+        recording its latency by route template, method and status"""
+        start = time.time()
+        status = 'error'
+        try:
+            response, content = self.transport.http_request(uri, headers, data, method)
+            status = response.code
+            return response, content
+        finally:
+            elapsed = time.time() - start
+            metrics.UPSTREAM_LATENCY.observe(elapsed,
+                                             method=method or 'GET',
+                                             route=metrics.route_template(uri),
+                                             status=status)
+            calls = self.request_calls()
+            if calls:
+                calls.add_wait(elapsed)
+
+
+    def request_calls(self):
+        """Return the RequestCalls of the current request, or of the request
+        which started the current worker thread; None outside of a request"""
+        calls = getattr(self._local, 'calls', None)
+        if calls is None and has_app_context():
+            calls = getattr(g, 'gitlab_calls', None)
+            if calls is None:
+                calls = g.gitlab_calls = RequestCalls()
+        return calls
+
+
+    def getall(self, method, *args, **kwargs):
         """Auto-iterate over the paginated results of various methods of the API.
         Pass the GitLabAPI method as the first argument, followed by the
         other parameters as normal. Include `page` to determine first page to poll.
         Remaining kwargs are passed on to the called method, including `per_page`.
 
+        Pages after the first one are fetched concurrently by `workers` threads,
+        up to the page count announced by the first page, or by probing batches
+        of pages until an empty one when the server does not announce it.
+
         :param method: Actual method to call
         :param *args: Positional arguments to actual method
         :param rpath: Relative resource path, like '/users'
         :param page: Page number to start at
+        :param workers: Number of pages fetched concurrently (1 to fetch them one by one)
+        :param until: Function called on each item, stopping the iteration and the
+        fetch of the next pages at the first item it returns True for
         :param **kwargs: Keyword arguments to actual method
         :return: Yields each item in the result until exhausted, and then
         implicit StopIteration; or no elements if error
         """
         rpath = kwargs.pop('rpath', '')
         page = kwargs.pop('page', '')
+        workers = kwargs.pop('workers', config.GITLAB_PAGE_WORKERS)
+        until = kwargs.pop('until', None)
+        if until is not None:
+            # Pages are only worth fetching until the stopping item
+            workers = 1
         if not all([page, rpath]):
             raise RuntimeError('Missing rpath or page arguments')
-        while True:
+
+        route = metrics.route_template(rpath)
+        first_page = page
+        try:
             results = method(*args, rpath=rpath, page=page, **kwargs)
             if not results:
-                break
+                return
             for result in results:
+                if until is not None and until(result):
+                    return
                 yield result
-            page += 1
+
+            if workers <= 1:
+                while True:
+                    page += 1
+                    results = method(*args, rpath=rpath, page=page, **kwargs)
+                    if not results:
+                        return
+                    for result in results:
+                        if until is not None and until(result):
+                            return
+                        yield result
+
+            fetch = self.bind(lambda number: method(*args, rpath=rpath, page=number, **kwargs))
+            last_page = getattr(results, 'total_pages', None)
+            if last_page is not None and last_page <= page:
+                return
+
+            pool = ThreadPool(min(workers, last_page - page) if last_page else workers)
+            try:
+                if last_page:
+                    for results in pool.imap(fetch, range(page + 1, last_page + 1)):
+                        page += 1
+                        for result in results:
+                            yield result
+                else:
+                    while True:
+                        batch = pool.map(fetch, range(page + 1, page + 1 + workers))
+                        for results in batch:
+                            page += 1
+                            if not results:
+                                return
+                            for result in results:
+                                yield result
+            finally:
+                pool.terminate()
+        finally:
+            metrics.CRAWL_PAGES.observe(page - first_page + 1, route=route)
 
 
     def get(self, path):
-        """Send get request (with auth)"""
+        """Send get request (with auth), once per Flask request for a same path"""
+        calls = self.request_calls()
+        if calls:
+            found, response = calls.lookup(path)
+            if found:
+                return response
+
         url = '%s%s' % (self._url, path)
         try:
             request = self.auth.get(url)
@@ -105,6 +465,8 @@ class Gitlab(object):
             raise StandardError(
                 "Failed to get a response from: %s" % url)
 
+        if calls:
+            calls.record(path if request.status == 200 else None, request.data)
         if request.status == 200:
             return request.data
         else:
@@ -123,7 +485,13 @@ class Gitlab(object):
             raise StandardError(
                 "Failed to post data at: %s" % url)
 
+        calls = self.request_calls()
+        if calls:
+            calls.record()
+            calls.forget()
+
         if request.status == 201:
+            self.invalidate(path, 'POST', request.data)
             return request.data
         else:
             _raise_error_from_response(request)
@@ -138,7 +506,13 @@ class Gitlab(object):
             raise StandardError(
                 "Failed to update data at: %s" % url)
 
+        calls = self.request_calls()
+        if calls:
+            calls.record()
+            calls.forget()
+
         if request.status == 200:
+            self.invalidate(path, 'PUT', request.data)
             return request.data
         else:
             _raise_error_from_response(request)
@@ -153,65 +527,384 @@ class Gitlab(object):
             raise StandardError(
                 "Failed to delete data from: %s" % url)
 
+        calls = self.request_calls()
+        if calls:
+            calls.record()
+            calls.forget()
+
         if request.status == 200:
+            self.invalidate(path, 'DELETE')
             return request.data
         else:
             _raise_error_from_response(request)
 
 
-    def get_paginated_resources(self, rpath, page=1, per_page=20):
+    def get_page_size(self):
+        """Return the number of items to request per page: the configured page size,
+        or in adaptive mode the largest size the server accepted"""
+        if not config.GITLAB_ADAPTIVE_PER_PAGE:
+            return config.GITLAB_PER_PAGE
+        return PAGINATION_STATS['per_page'] or config.GITLAB_MAX_PER_PAGE
+
+
+    def get_paginated_resources(self, rpath, page=1, per_page=None, params=None, project=False):
         """Return a dictionary list for a given resource
 
         :param page: Which page to return (default is 1)
-        :param per_page: Number of items to return per page (default is 20)
-        :return: returs a dictionary of the given resource searched, false if there is an error
+        :param per_page: Number of items to return per page (default is adaptive,
+        see get_page_size)
+        :param params: other query parameters, like {'order_by': 'last_activity_at'}
+        :param project: project the items to the records of the listing as the page
+        arrives, so that its full objects are freed at once
+        :return: returs a Page of the given resource searched, false if there is an error
         """
+        adaptive = per_page is None and config.GITLAB_ADAPTIVE_PER_PAGE
+        if per_page is None:
+            per_page = self.get_page_size()
+        calls = self.request_calls()
+        key = (rpath, page, per_page, tuple(sorted((params or {}).items())), project)
+        if calls:
+            found, response = calls.lookup(key)
+            if found:
+                return response
         try:
             url = '%s%s' % (self._url, rpath)
-            params = {'page': page, 'per_page': per_page}
+            query = dict(params or {})
+            query.update({'page': page, 'per_page': per_page})
 
-            request = self.auth.get(url, params)
+            request = self.auth.get(url, query)
         except Exception:
             raise StandardError(
                 "Failed to get a response from: %s" % url)
 
+        result = None
         if request.status == 200:
-            return request.data
+            items = request.data
+            if project:
+                items = [records.project(rpath, item) for item in items]
+            result = Page(items, getattr(request._resp, 'headers', None), per_page)
+        if calls:
+            calls.record(key if result is not None else None, result)
+        if result is not None:
+            with PAGINATION_LOCK:
+                PAGINATION_STATS['requests'] += 1
+                if adaptive and result.per_page < per_page:
+                    # The server caps the page size below the requested one
+                    PAGINATION_STATS['per_page'] = result.per_page
+                if page == 1 and result.total and result.per_page > config.GITLAB_PER_PAGE:
+                    pages = (result.total + result.per_page - 1) // result.per_page
+                    default_pages = (result.total + config.GITLAB_PER_PAGE - 1) // config.GITLAB_PER_PAGE
+                    PAGINATION_STATS['requests_saved'] += default_pages - pages
+            return result
+        elif adaptive and page == 1 and request.status in (400, 422) \
+                and per_page > config.GITLAB_PER_PAGE:
+            # The server rejects the page size, fall back to the configured one
+            with PAGINATION_LOCK:
+                PAGINATION_STATS['per_page'] = config.GITLAB_PER_PAGE
+            return self.get_paginated_resources(rpath, page, config.GITLAB_PER_PAGE, params,
+                                                project)
         else:
             _raise_error_from_response(request)
 
 
+    def invalidate(self, path, method, data=None):
+        """Patch or drop the cached listings changed by a write on a path
+
+        :param path: relative path of the write request, like '/projects?sudo=user'
+        :param method: HTTP method of the write request
+        :param data: object returned by the write request
+        """
+        path = path.split('?')[0]
+        for pattern, kind in SNAPSHOT_WRITES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            source_id = int(match.group('id'))
+            if kind != 'branches':
+                if self.snapshot:
+                    self.snapshot.forget_members(kind, source_id)
+            elif method == 'POST' and isinstance(data, dict) and data.get('name'):
+                self.change_branches(source_id, created=[data['name']])
+            elif method == 'DELETE' and match.group('name'):
+                self.change_branches(source_id, deleted=[unquote(match.group('name'))])
+            else:
+                self.forget_branches(source_id)
+        for pattern, listing, mode in LISTING_WRITES:
+            match = pattern.match(path)
+            if not match:
+                continue
+            item_id = match.groupdict().get('id')
+            if mode == 'refetch' and self.cache.get(listing) is not None:
+                self.patch_listing(listing, item=self.get('/projects/{0}'.format(item_id)))
+            elif mode == 'patch' and method == 'DELETE' and item_id:
+                self.patch_listing(listing, remove_id=int(item_id))
+            elif mode == 'patch' and method in ('POST', 'PUT') and isinstance(data, dict) \
+                    and 'id' in data and 'name' in data:
+                self.patch_listing(listing, item=data)
+            else:
+                self.cache.invalidate(listing)
+
+
+    def patch_listing(self, listing, item=None, remove_id=None):
+        """Add, replace or remove one item of a listing, in the snapshot store
+        even when it is not cached, and in the cache and the namespace index,
+        without crawling the resource again
+
+        :param listing: Relative resource path of the listing, like '/projects/all'
+        :param item: item to add or replace, projected to the record of the listing
+        :param remove_id: id of the item to remove
+        """
+        if item:
+            item = records.project(listing, item)
+        item_id = item['id'] if item else remove_id
+        previous = dict()
+
+        def patch(items):
+            """Return a new sorted listing with the change applied"""
+            previous['items'] = items
+            patched = [x for x in items if x['id'] != item_id]
+            if item:
+                patched.append(item)
+                patched.sort(key=lambda k: k['name'])
+            return patched
+
+        if self.snapshot:
+            self.snapshot.patch_listing(listing, item, remove_id)
+        patched = self.cache.update(listing, patch)
+        if patched is None:
+            return
+        if listing == '/projects/all':
+            if item:
+                self.index.add_project(item, previous['items'], patched)
+            else:
+                self.index.remove_project(remove_id, previous['items'], patched)
+        elif listing == '/groups':
+            if item:
+                self.index.add_group(item, previous['items'], patched)
+            else:
+                self.index.remove_group(remove_id, previous['items'], patched)
+
+
+    def walk_listing(self, rpath, **kwargs):
+        """Yield the records of every page of a listing, the items of each page
+        being projected as soon as it is read, by the thread fetching it
+
+        :param rpath: Relative resource path, like '/users'
+        :param **kwargs: params and until of getall
+        """
+        for item in self.getall(self.get_paginated_resources,
+                                rpath=rpath,
+                                page=1,
+                                project=True,
+                                **kwargs):
+            yield item
+
+
+    def crawl_listing(self, rpath):
+        """Walk every page of a resource
+
+        :param rpath: Relative resource path, like '/users'
+        :return: the record list of the resource sorted by name
+        """
+        return sorted(self.walk_listing(rpath), key=lambda k: k['name'])
+
+
+    def sync_projects(self, full=False):
+        """Update the cached project listing with the projects active since the
+        last sync, walking the projects by last activity until older ones.
+        Deleted projects are only dropped by the full crawls, done when nothing
+        is cached yet and every PROJECT_SYNC_FULL_INTERVAL seconds.
+
+        :param full: crawl every project
+        :return: the synced project listing
+        """
+        rpath = '/projects/all'
+        listing = self.cache.get(rpath)
+        with PROJECT_SYNC_LOCK:
+            watermark = PROJECT_SYNC['watermark']
+            last_full = PROJECT_SYNC['last_full']
+        full = full or listing is None or watermark is None or last_full is None \
+            or time.time() - last_full >= config.PROJECT_SYNC_FULL_INTERVAL
+
+        start = time.time()
+        if full:
+            changed = self.crawl_listing(rpath)
+            projects = changed
+        else:
+            # Activity dates are ISO 8601 UTC strings, ordered as strings
+            changed = list(self.walk_listing(rpath,
+                                             params={'order_by': 'last_activity_at',
+                                                     'sort': 'desc'},
+                                             until=lambda k: (k.get('last_activity_at')
+                                                              or '') < watermark))
+            projects = dict((project['id'], project) for project in listing)
+            for project in changed:
+                projects[project['id']] = project
+            projects = sorted(projects.values(), key=lambda k: k['name'])
+
+        activities = [project.get('last_activity_at') or '' for project in changed]
+        if full:
+            self.store_listing(rpath, projects)
+        else:
+            self.cache.set(rpath, projects)
+            if self.snapshot:
+                self.snapshot.update_listing(rpath, changed)
+        self.index.sync_projects(projects)
+        with PROJECT_SYNC_LOCK:
+            if full:
+                PROJECT_SYNC['watermark'] = max(activities or [''])
+                PROJECT_SYNC['last_full'] = time.time()
+            else:
+                PROJECT_SYNC['watermark'] = max(activities + [watermark])
+            PROJECT_SYNC.update({'last_sync': time.time(),
+                                 'mode': 'full' if full else 'incremental',
+                                 'changed': len(changed),
+                                 'duration': round(time.time() - start, 3)})
+        return projects
+
+
+    def get_listing(self, rpath):
+        """Return a listing sorted by name, served from the shared cache
+
+        :param rpath: Relative resource path, like '/users'
+        :return: the record list of the resource sorted by name
+        """
+        return self.cache.get_or_load(rpath, self.listing_loader(rpath))
+
+
+    def listing_loader(self, rpath):
+        """Return the loader of a listing, callable from any thread
+
+        :param rpath: Relative resource path, like '/users'
+        """
+        def crawl():
+            """Read the resource from the snapshot store when another process
+            stored it recently, or walk every page of it, from any thread"""
+            stored = self.load_stored_listing(rpath)
+            if stored is not None:
+                return stored
+            items = self.crawl_listing(rpath)
+            if self.snapshot:
+                self.snapshot.save_listing(rpath, items)
+            return items
+
+        return self.bind(crawl)
+
+
+    def load_stored_listing(self, rpath):
+        """Return a listing of the snapshot store stored recently by another
+        process, None if there is none
+
+        :param rpath: Relative resource path, like '/users'
+        """
+        if self.snapshot:
+            stored = self.snapshot.load_listing(rpath, self.cache.ttl)
+            if stored is not None:
+                return stored[0]
+        return None
+
+
+    def store_listing(self, rpath, items):
+        """Swap a crawled listing in the cache and in the snapshot store
+
+        :param rpath: Relative resource path, like '/users'
+        :param items: the sorted record list of the resource
+        """
+        self.cache.set(rpath, items)
+        if self.snapshot:
+            self.snapshot.save_listing(rpath, items)
+
+
+    def iter_listing(self, rpath):
+        """Yield the items of a listing as its pages arrive, then cache the
+        sorted listing. The cached listing, reloaded in the background when
+        stale, and the listing stored by another process are yielded at once,
+        and concurrent requests share the crawl in progress, which a thread
+        runs whatever the pace of the clients reading them.
+
+        :param rpath: Relative resource path, like '/users'
+        """
+        def produce(emit):
+            """Emit the stored listing, or the records of the pages as they
+            arrive, and return the sorted listing to cache"""
+            items = self.load_stored_listing(rpath)
+            if items is not None:
+                for item in items:
+                    emit(item)
+                return items
+            items = list()
+            for item in self.walk_listing(rpath):
+                items.append(item)
+                emit(item)
+            items.sort(key=lambda k: k['name'])
+            if self.snapshot:
+                self.snapshot.save_listing(rpath, items)
+            return items
+
+        return self.cache.iter_or_load(rpath, self.listing_loader(rpath), self.bind(produce))
+
+
     def get_all_users(self):
         """Return a user list"""
-        users = [x for x in self.getall(self.get_paginated_resources,
-                                        rpath='/users',
-                                        page=1,
-                                        per_page=20)
-                ]
-        return sorted(users, key=lambda k: k['name'])
+        return self.get_listing('/users')
 
 
     def get_all_groups(self):
         """Return a group list"""
-        users = [x for x in self.getall(self.get_paginated_resources,
-                                        rpath='/groups',
-                                        page=1,
-                                        per_page=20)
-                ]
-        return sorted(users, key=lambda k: k['name'])
+        return self.get_listing('/groups')
 
 
     def get_all_projects(self):
-        """Returns a dictionary list of all the projects
+        """Returns a record list of all the projects
 
-        :return: list with the repo name, description, last activity,web url...
+        :return: list with the id, name, path and namespace of the projects,
+        see get_full_record for the other fields
         """
-        users = [x for x in self.getall(self.get_paginated_resources,
-                                        rpath='/projects/all',
-                                        page=1,
-                                        per_page=20)
-                ]
-        return sorted(users, key=lambda k: k['name'])
+        return self.get_listing('/projects/all')
+
+
+    def get_full_record(self, record):
+        """Fetch the full object of a listing record, with the fields
+        which are not kept in the cached listings
+
+        :param record: user, group or project record
+        :return: dictionary of the object
+        """
+        return self.get('{0}/{1}'.format(record.resource, record['id']))
+
+
+    def get_project_index(self):
+        """Return the namespace index, synced with the cached project listing"""
+        self.index.sync_projects(self.get_all_projects())
+        return self.index
+
+
+    def get_group_index(self):
+        """Return the namespace index, synced with the cached group listing"""
+        self.index.sync_groups(self.get_all_groups())
+        return self.index
+
+
+    def search_listing(self, rpath, query, page=1, per_page=20, group=None):
+        """Search a listing by prefix, with the prefix index of the cached listing
+
+        :param rpath: Relative resource path, like '/users'
+        :param query: searched prefix of a name, username or path
+        :param page: Which page to return (default is 1)
+        :param per_page: Number of items to return per page (default is 20)
+        :param group: only return the projects of this group name
+        :return: the number of matching items, and the items of the page
+        """
+        listing = self.get_listing(rpath)
+        with SEARCH_LOCK:
+            indexed = SEARCH_INDEXES.get(rpath)
+            if indexed is None or indexed[0] is not listing:
+                indexed = SEARCH_INDEXES[rpath] = (listing,
+                                                   PrefixIndex(listing, SEARCH_KEYS[rpath]))
+        where = None
+        if group:
+            where = lambda project: project['namespace']['name'] == group
+        return indexed[1].search(query, (page - 1) * per_page, per_page, where)
 
 
     def get_project_with_namespace(self, path_with_namespace):
@@ -219,42 +912,161 @@ class Gitlab(object):
 
         :param path_with_namespace: mygroup/myproject
         """
+        if self.snapshot and not self.cache.contains('/projects/all'):
+            project = self.snapshot.project_with_namespace(path_with_namespace, self.cache.ttl)
+            if project is not None:
+                return project
+        return self.get_project_index().project_with_namespace(path_with_namespace)
+
+
+    def get_project_with_id(self, project_id):
+        """Retrieve project information
+
+        :param project_id: the project id
+        """
+        return self.get_project_index().project_with_id(project_id)
+
+
+    def lookup_project(self, path_with_namespace):
+        """Retrieve project information from the cached listing, or else from
+        the snapshot store or a single call while the listing loads in the
+        background, rather than waiting for a crawl of every project
+
+        :param path_with_namespace: mygroup/myproject
+        :return: the project record, None if unknown
+        """
+        if self.cache.contains('/projects/all'):
+            return self.get_project_index().project_with_namespace(path_with_namespace)
+        if self.snapshot:
+            project = self.snapshot.project_with_namespace(path_with_namespace, self.cache.ttl)
+            if project is not None:
+                return project
+        thread = threading.Thread(target=self.bind(self.get_listing), args=('/projects/all',))
+        thread.daemon = True
+        thread.start()
         try:
-            for project in self.get_all_projects():
-                if project['path_with_namespace'] == path_with_namespace:
-                    return project
-        except ValueError:
-            pass
+            project = self.get('/projects/{0}'.format(quote(path_with_namespace.encode('utf-8'),
+                                                            safe='')))
+        except StandardError:
+            return None
+        return records.project('/projects/all', project)
 
 
     def get_project_branches(self, path_with_namespace):
         """List all the branches from a project
 
         :param path_with_namespace: mygroup/myproject
-        :return: list of project branches
+        :return: list of project branches, None if the project is unknown
         """
         try:
-            project_id = self.get_project_with_namespace(path_with_namespace)['id']
-            project_branches = []
-            branches = self.get('/projects/{0}/repository/branches'.format(project_id))
-            for branch in branches:
-                project_branches.append(branch['name'])
-            return project_branches
+            project = self.lookup_project(path_with_namespace)
+            if project is None:
+                return None
+            return self.get_branches(project['id'])
         except ValueError:
             pass
 
 
+    def get_branches(self, project_id):
+        """List the branches of a project from the branch cache, or else from
+        the snapshot store or GitLab
+
+        :param project_id: the project id
+        :return: list of branch names, shared by the callers
+        """
+        self.sync_branch_events()
+
+        def load():
+            """Read the branches stored by another process, or fetch them"""
+            if self.snapshot:
+                branches = self.snapshot.load_branches(project_id, self.branches.ttl)
+                if branches is not None:
+                    return branches
+            branches = [branch['name'] for branch in
+                        self.get('/projects/{0}/repository/branches'.format(project_id))]
+            if self.snapshot:
+                self.snapshot.save_branches(project_id, branches)
+            return branches
+
+        return self.branches.get_or_load(project_id, self.bind(load))
+
+
+    def change_branches(self, project_id, created=(), deleted=()):
+        """Apply branches created or deleted in a project to the branch cache
+        and the snapshot store, and tell the other processes
+
+        :param project_id: the project id
+        :param created: names of the branches created
+        :param deleted: names of the branches deleted
+        :return: the new branch names, None if they were not cached
+        """
+        def change(branches):
+            """Return a new branch list with the change applied"""
+            changed = [name for name in branches if name not in deleted]
+            return changed + [name for name in created if name not in changed]
+
+        branches = self.branches.update(project_id, change)
+        if self.snapshot:
+            if branches is None:
+                self.snapshot.forget_branches(project_id)
+            else:
+                self.snapshot.save_branches(project_id, branches)
+            self.snapshot.record_branch_event(project_id)
+        return branches
+
+
+    def forget_branches(self, project_id):
+        """Drop the cached branches of a project, and tell the other processes
+
+        :param project_id: the project id
+        """
+        self.branches.invalidate(project_id)
+        if self.snapshot:
+            self.snapshot.forget_branches(project_id)
+            self.snapshot.record_branch_event(project_id)
+
+
+    def sync_branch_events(self):
+        """Drop the cached branches changed by the hooks or the writes of the
+        other processes sharing the snapshot store, at most every
+        BRANCH_EVENTS_INTERVAL seconds"""
+        if not self.snapshot:
+            return
+        with BRANCH_EVENTS_LOCK:
+            if time.time() - BRANCH_EVENTS['checked'] < config.BRANCH_EVENTS_INTERVAL:
+                return
+            BRANCH_EVENTS['checked'] = time.time()
+            project_ids, BRANCH_EVENTS['seen'] = self.snapshot.branch_events(BRANCH_EVENTS['seen'])
+        for project_id in project_ids:
+            self.branches.invalidate(project_id)
+
+
+    def apply_hook(self, event):
+        """Apply a push or system hook of GitLab to the cached branches, and
+        the deletion of a project to the cached project listing
+
+        :param event: JSON body of the hook
+        :return: id of the project changed, None if the hook changes nothing cached
+        """
+        change = hooks.branch_changes(event)
+        if change is not None:
+            project_id, created, deleted = change
+            self.change_branches(project_id, created, deleted)
+            return project_id
+        project_id = hooks.destroyed_project(event)
+        if project_id is not None:
+            self.forget_branches(project_id)
+            self.patch_listing('/projects/all', remove_id=project_id)
+        return project_id
+
+
     def get_projects_in_group(self, group):
-        """Returns a dictionary list of all the projects for a group name
+        """Returns a record list of all the projects for a group name
 
         :param group: group name
-        :return: list with the repo name, description, last activity,web url...
+        :return: list with the id, name, path and namespace of the projects
         """
-        result = list()
-        for project in self.get_all_projects():
-            if project['namespace']['name'] == group:
-                result.append(project)
-        return result
+        return self.get_project_index().projects_in_group(group)
 
 
     def get_group_with_name(self, name):
@@ -262,37 +1074,59 @@ class Gitlab(object):
 
         :param name: group name
         """
-        try:
-            for group in self.get_all_groups():
-                if name == group['name']:
-                    return group
-        except ValueError:
-            pass
+        return self.get_group_index().group_with_name(name)
 
 
-    def get_member_group(self, group_name, username):
-        """Lists the members of a given group name
+    def read_members(self, source, source_id, max_age=None):
+        """List every member of a group or project from the snapshot store when
+        they were stored recently, or else from GitLab, storing them
 
-        :param group_name: the group_name id
-        :return: the group's members
+        :param source: 'group' or 'project'
+        :param source_id: id of the group or project
+        :param max_age: seconds the stored members are used (default is
+        MEMBERS_SNAPSHOT_TTL, 0 reads them from GitLab)
+        :return: the dictionary list of the members
         """
-        try:
-            group_id = self.get_group_with_name(group_name)['id']
-            group_members = self.get('/groups/{0}/members'.format(group_id))
-            for member in group_members:
-                if username == member['username']:
-                    return member
-        except ValueError:
-            pass
+        if max_age is None:
+            max_age = config.MEMBERS_SNAPSHOT_TTL
+        if self.snapshot and max_age:
+            members = self.snapshot.load_members(source, source_id, max_age)
+            if members is not None:
+                return members
+        members = list(self.getall(self.get_paginated_resources,
+                                   rpath='/{0}s/{1}/members'.format(source, source_id),
+                                   page=1))
+        if self.snapshot:
+            self.snapshot.save_members(source, source_id, members)
+        return members
+
+
+    def get_member_group(self, group_name, username, members=None):
+        """Retrieve the member of a given group name with a username
+
+        :param group_name: the group name
+        :param username: the username
+        :param members: MembershipIndex of the operation, reading the members
+        of a group once for every user (default reads them for this call)
+        :return: the member id, username and access_level, None if not a member
+        """
+        group = self.get_group_with_name(group_name)
+        if group is None:
+            return None
+        members = members or MembershipIndex(self.read_members)
+        return members.member_with_username('group', group['id'], username)
 
 
-    def manage_project(self, user, name, group, access, action, import_url, del_user_project):
+    def manage_project(self, user, name, group, access, action, import_url, del_user_project,
+                       progress=None):
         """
         Manage projects
+
+        :param progress: optional function called with each operation done
         """
         username = str(user.split(",")[0])
         user_id = int(user.split(",")[1])
-        result = list()
+        result = OperationLog(progress)
         path = group + "/" + name
         project = self.get_project_with_namespace(path)
 
@@ -402,24 +1236,192 @@ class Gitlab(object):
 
         return result
 
-    def manage_user_env(self, user, projects, env_action):
+    def manage_user_env(self, user, projects, env_action, progress=None):
         """
         Manage user env
+
+        The projects of the rows are resolved first, then the rows run
+        concurrently, one task per project so that rows of a same project
+        stay in order, and group memberships are looked up once per group.
+
+        :param progress: optional function called with each operation done
         """
 
         username = str(user.split(",")[0])
         user_id = int(user.split(",")[1])
         result = list()
         projects = json.loads(projects)
+        batch = Batch(self, config.BATCH_WORKERS)
 
-        for project in projects:
+        index = self.get_project_index()
+        tasks = OrderedDict()
+        for position, project in enumerate(projects):
             path = project['group'] + "/" + project['name']
-            current_project = self.get_project_with_namespace(path)
+            current_project = index.project_with_namespace(path)
+            key = current_project['id'] if current_project else path
+            tasks.setdefault(key, []).append((position, project, current_project))
+
+        def run_task(rows):
+            """Manage the rows of a project"""
+            done = list()
+            for position, project, current_project in rows:
+                operations = self.manage_user_env_project(batch, username, user_id,
+                                                          project, current_project,
+                                                          env_action)
+                for operation in operations:
+                    if progress:
+                        progress(operation)
+                done.append((position, operations))
+            return done
+
+        for _, operations in sorted(sum(batch.map(run_task, list(tasks.values())), [])):
+            result.extend(operations)
 
-            if current_project:
+        return result
+
+    def manage_user_env_project(self, batch, username, user_id, project,
+                                current_project, env_action):
+        """
+        Manage user env of a project row
+        """
+        result = list()
+        path = project['group'] + "/" + project['name']
+
+        if current_project:
+
+            op_branch = "{0} branch {1} in project {2}".format(env_action,
+                                                               username,
+                                                               project['name']
+                                                              )
+            op_member = "{0} member {1} on project {2}".format(env_action,
+                                                               username,
+                                                               project['name']
+                                                              )
+
+            if env_action == "create":
+
+                branch_url = '/projects/{0}/repository/branches'.format(current_project['id'])
+                current_project_branches = self.get_branches(current_project['id'])
+
+                if project['branch'] and username not in current_project_branches:
+
+                    branch_data = {
+                        "id":current_project['id'],
+                        "branch_name":username,
+                        "ref":project['branch']
+                        }
+                    branch = self.post(branch_url, branch_data)
+                    result.append({op_branch: branch})
+                else:
+                    result.append({op_branch: "Nothing to do"})
+
+                if project['access']:
+
+                    # Check if user is already in project's group
+                    member = self.get_member_group(project['group'], username, batch.members)
+                    if member == None:
+
+                        op_member_url = '/projects/{0}/members'.format(current_project['id'])
+
+                        if not batch.members.has_user('project', current_project['id'], user_id):
+                            op_member_data = {
+                                "id":current_project['id'],
+                                "user_id":user_id,
+                                "access_level":project['access']
+                                }
+                            member = self.post(op_member_url, op_member_data)
+                            batch.members.add('project', current_project['id'],
+                                              user_id, username, project['access'])
+                            result.append({op_member: member})
+
+                else:
+                    result.append({op_member: "Nothing to do"})
+
+            elif env_action == "delete":
+
+                branch_url = '/projects/{0}/repository/branches'.format(current_project['id'])
+                current_project_branches = self.get_branches(current_project['id'])
+
+                if username in current_project_branches:
+                    branch = self.delete('{0}/{1}'.format(branch_url, username))
+                    result.append({op_branch: branch})
+                else:
+                    result.append({op_branch: "Nothing to do"})
+
+                member_url = '/projects/{0}/members'.format(current_project['id'])
+
+                if batch.members.has_user('project', current_project['id'], user_id):
+                    member = self.delete('{0}/{1}'.format(member_url, user_id))
+                    batch.members.remove('project', current_project['id'], user_id)
+                    result.append({op_member: member})
+
+                else:
+                    result.append({op_member: "Nothing to do"})
+
+        else:
+            result.append({"Error": "Project {0} not found".format(path)})
+
+        return result
+
+    def manage_users_env(self, users, projects, env_action, progress=None):
+        """
+        Manage the env of several users on several projects
 
-                member = self.get_member_group(project['group'], username)
+        Projects, branches and memberships are read once for all the users,
+        then only the missing branch and member changes are written, concurrently.
 
+        :param users: list of (username, user_id)
+        :param projects: list of {group, name, access, branch} rows
+        :param env_action: create or delete
+        :param progress: optional function called with each operation done
+        :return: dictionary of the operations by username
+        """
+        batch = Batch(self, config.BATCH_WORKERS)
+        index = self.get_project_index()
+        report = OrderedDict((username, list()) for username, _ in users)
+
+        rows = list()
+        for project in projects:
+            path = project['group'] + "/" + project['name']
+            current_project = index.project_with_namespace(path)
+            if current_project:
+                rows.append((project, current_project))
+            else:
+                for operations in report.values():
+                    operations.append({"Error": "Project {0} not found".format(path)})
+
+        members = batch.members
+
+        def read_project(current_project):
+            """Return the branch names of a project, and read its members"""
+            members.load('project', current_project['id'])
+            return set(self.get_branches(current_project['id']))
+
+        def read_group(name):
+            """Return the id of a group name, and read its members"""
+            group = self.get_group_with_name(name)
+            if group is None:
+                return None
+            members.load('group', group['id'])
+            return group['id']
+
+        unique_projects = list(OrderedDict((current_project['id'], current_project)
+                                           for _, current_project in rows).values())
+        states = dict(zip([x['id'] for x in unique_projects],
+                          batch.map(read_project, unique_projects)))
+        groups = list()
+        if env_action == "create":
+            groups = list(set(project['group'] for project, _ in rows if project['access']))
+        group_ids = dict(zip(groups, batch.map(read_group, groups)))
+
+        # Plan the writes, keeping the place of their result in the report
+        writes = list()
+        for username, user_id in users:
+            for project, current_project in rows:
+                branches = states[current_project['id']]
+                project_id = current_project['id']
+                branch_url = '/projects/{0}/repository/branches'.format(current_project['id'])
+                member_url = '/projects/{0}/members'.format(current_project['id'])
                 op_branch = "{0} branch {1} in project {2}".format(env_action,
                                                                    username,
                                                                    project['name']
@@ -428,76 +1430,70 @@ class Gitlab(object):
                                                                    username,
                                                                    project['name']
                                                                   )
+                planned = list()
 
                 if env_action == "create":
-
-                    branch_url = '/projects/{0}/repository/branches'.format(current_project['id'])
-                    current_project_branches = self.get(branch_url)
-                    index_branch = find_element_in_list(current_project_branches, username, "name")
-                    print index_branch
-
-                    if project['branch'] and index_branch == None:
-
+                    if project['branch'] and username not in branches:
+                        branches.add(username)
                         branch_data = {
                             "id":current_project['id'],
                             "branch_name":username,
                             "ref":project['branch']
                             }
-                        branch = self.post(branch_url, branch_data)
-                        result.append({op_branch: branch})
+                        planned.append((op_branch, self.post, (branch_url, branch_data)))
                     else:
-                        result.append({op_branch: "Nothing to do"})
+                        planned.append((op_branch, None, None))
 
                     if project['access']:
-
-                        # Check if user is already in project's group
-                        if member == None:
-
-                            current_project_members = []
-                            op_member_url = '/projects/{0}/members'.format(current_project['id'])
-                            for member in self.get(op_member_url):
-                                current_project_members.append(member['id'])
-
-                            if not user_id in current_project_members:
-                                op_member_data = {
-                                    "id":current_project['id'],
-                                    "user_id":user_id,
-                                    "access_level":project['access']
-                                    }
-                                member = self.post(op_member_url, op_member_data)
-                                result.append({op_member: member})
-
+                        group_id = group_ids[project['group']]
+                        in_group = group_id is not None \
+                            and members.has_username('group', group_id, username)
+                        if not in_group and not members.has_user('project', project_id, user_id):
+                            members.add('project', project_id, user_id, username, project['access'])
+                            member_data = {
+                                "id":current_project['id'],
+                                "user_id":user_id,
+                                "access_level":project['access']
+                                }
+                            planned.append((op_member, self.post, (member_url, member_data)))
                     else:
-                        result.append({op_member: "Nothing to do"})
+                        planned.append((op_member, None, None))
 
                 elif env_action == "delete":
-
-                    current_project_branches = []
-                    branch_url = '/projects/{0}/repository/branches'.format(current_project['id'])
-                    for branch in self.get(branch_url):
-                        current_project_branches.append(branch['name'])
-
-                    if username in current_project_branches:
-                        branch = self.delete('{0}/{1}'.format(branch_url, username))
-                        result.append({op_branch: branch})
+                    if username in branches:
+                        branches.discard(username)
+                        planned.append((op_branch, self.delete,
+                                        ('{0}/{1}'.format(branch_url, username),)))
                     else:
-                        result.append({op_branch: "Nothing to do"})
-
-                    member_url = '/projects/{0}/members'.format(current_project['id'])
-                    current_project_members = self.get(member_url)
-                    index_member = find_element_in_list(current_project_members, user_id, "id")
-
-                    if index_member >= 0:
-                        member = self.delete('{0}/{1}'.format(member_url,
-                                                              current_project_members[index_member]
-                                                             )
-                                            )
-                        result.append({op_member: member})
+                        planned.append((op_branch, None, None))
 
+                    if members.has_user('project', project_id, user_id):
+                        members.remove('project', project_id, user_id)
+                        planned.append((op_member, self.delete,
+                                        ('{0}/{1}'.format(member_url, user_id),)))
                     else:
-                        result.append({op_member: "Nothing to do"})
-
-            else:
-                result.append({"Error": "Project {0} not found".format(path)})
+                        planned.append((op_member, None, None))
 
-        return result
+                for operation, method, args in planned:
+                    if method is None:
+                        report[username].append({operation: "Nothing to do"})
+                    else:
+                        report[username].append(None)
+                        writes.append((username, len(report[username]) - 1,
+                                       operation, method, args))
+
+        def write(planned_write):
+            """Send a planned write, returning its operation result"""
+            _, _, operation, method, args = planned_write
+            try:
+                done = {operation: method(*args)}
+            except StandardError as error:
+                done = {"Error": "{0}: {1}".format(operation, error)}
+            if progress:
+                progress(done)
+            return done
+
+        for planned_write, done in zip(writes, batch.map(write, writes)):
+            report[planned_write[0]][planned_write[1]] = done
+
+        return report
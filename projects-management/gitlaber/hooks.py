@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+'''
+Flask hooks
+'''
+
+from __future__ import absolute_import
+
+# Commit id of the before or after side of a push creating or deleting a ref
+BLANK_COMMIT = '0' * 40
+BRANCH_PREFIX = 'refs/heads/'
+
+
+def _ref_change(change):
+    """Return the branch created and the branch deleted by a ref change
+
+    :param change: dictionary with the ref, before and after commit ids
+    :return: (created branch or None, deleted branch or None)
+    """
+    ref = change.get('ref') or ''
+    if not ref.startswith(BRANCH_PREFIX):
+        return None, None
+    name = ref[len(BRANCH_PREFIX):]
+    if change.get('before') == BLANK_COMMIT:
+        return name, None
+    if change.get('after') == BLANK_COMMIT:
+        return None, name
+    return None, None
+
+
+def branch_changes(event):
+    """Return the branches created and deleted by a push hook of a project,
+    or by a push or repository_update system hook
+
+    :param event: JSON body of the hook
+    :return: (project id, created branch names, deleted branch names), None
+    when the hook does not change the branches of a project
+    """
+    kind = event.get('object_kind') or event.get('event_name')
+    if kind == 'push':
+        changes = [event]
+    elif kind == 'repository_update':
+        changes = event.get('changes') or []
+    else:
+        return None
+    created, deleted = list(), list()
+    for change in changes:
+        branch, removed = _ref_change(change)
+        if branch:
+            created.append(branch)
+        if removed:
+            deleted.append(removed)
+    project_id = event.get('project_id')
+    if project_id is None or not (created or deleted):
+        return None
+    return int(project_id), created, deleted
+
+
+def destroyed_project(event):
+    """Return the id of the project deleted by a project_destroy system hook,
+    None for the other hooks
+
+    :param event: JSON body of the hook
+    """
+    if event.get('event_name') == 'project_destroy' and event.get('project_id') is not None:
+        return int(event['project_id'])
+    return None
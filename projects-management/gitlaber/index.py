@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+Flask index
+'''
+
+from __future__ import absolute_import
+
+import threading
+from bisect import bisect_left
+
+
+def _by_name(item):
+    """Sort key of the listings"""
+    return item['name']
+
+
+class NamespaceIndex(object):
+    """Dictionary index of the projects and groups listings"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._projects_source = None
+        self._groups_source = None
+        self.projects_by_path = {}
+        self.projects_by_id = {}
+        self.projects_by_group = {}
+        self.groups_by_name = {}
+
+
+    def sync_projects(self, projects):
+        """Rebuild the project index if the listing is not the indexed one
+
+        :param projects: the project listing
+        """
+        with self._lock:
+            if projects is self._projects_source:
+                return
+            self.projects_by_path = {}
+            self.projects_by_id = {}
+            self.projects_by_group = {}
+            for project in projects:
+                self._index_project(project)
+            self._projects_source = projects
+
+
+    def sync_groups(self, groups):
+        """Rebuild the group index if the listing is not the indexed one
+
+        :param groups: the group listing
+        """
+        with self._lock:
+            if groups is self._groups_source:
+                return
+            self.groups_by_name = dict((group['name'], group) for group in groups)
+            self._groups_source = groups
+
+
+    def _index_project(self, project):
+        """Add a project to the dictionaries"""
+        self.projects_by_path[project['path_with_namespace']] = project
+        self.projects_by_id[project['id']] = project
+        group = project['namespace']['name']
+        self.projects_by_group.setdefault(group, []).append(project)
+
+
+    def add_project(self, project, listing, patched):
+        """Add or replace a project without rebuilding the index
+
+        :param project: the project
+        :param listing: the listing before the change
+        :param patched: the listing after the change
+        """
+        with self._lock:
+            if self._projects_source is not listing:
+                return
+            self.remove_project(project['id'], listing, listing)
+            self._index_project(project)
+            self.projects_by_group[project['namespace']['name']].sort(key=_by_name)
+            self._projects_source = patched
+
+
+    def remove_project(self, project_id, listing, patched):
+        """Remove a project without rebuilding the index
+
+        :param project_id: the project id
+        :param listing: the listing before the change
+        :param patched: the listing after the change
+        """
+        with self._lock:
+            if self._projects_source is not listing:
+                return
+            project = self.projects_by_id.pop(project_id, None)
+            if project:
+                self.projects_by_path.pop(project['path_with_namespace'], None)
+                group = self.projects_by_group.get(project['namespace']['name'], [])
+                if project in group:
+                    group.remove(project)
+            self._projects_source = patched
+
+
+    def add_group(self, group, listing, patched):
+        """Add or replace a group without rebuilding the index
+
+        :param group: the group
+        :param listing: the listing before the change
+        :param patched: the listing after the change
+        """
+        with self._lock:
+            if self._groups_source is not listing:
+                return
+            self.remove_group(group['id'], listing, listing)
+            self.groups_by_name[group['name']] = group
+            self._groups_source = patched
+
+
+    def remove_group(self, group_id, listing, patched):
+        """Remove a group without rebuilding the index
+
+        :param group_id: the group id
+        :param listing: the listing before the change
+        :param patched: the listing after the change
+        """
+        with self._lock:
+            if self._groups_source is not listing:
+                return
+            for name, group in list(self.groups_by_name.items()):
+                if group['id'] == group_id:
+                    del self.groups_by_name[name]
+            self._groups_source = patched
+
+
+    def project_with_namespace(self, path_with_namespace):
+        """Return the project of a path like mygroup/myproject, None if unknown"""
+        with self._lock:
+            return self.projects_by_path.get(path_with_namespace)
+
+
+    def project_with_id(self, project_id):
+        """Return the project of an id, None if unknown"""
+        with self._lock:
+            return self.projects_by_id.get(project_id)
+
+
+    def projects_in_group(self, group):
+        """Return the projects of a group name sorted by name"""
+        with self._lock:
+            return list(self.projects_by_group.get(group, []))
+
+
+    def group_with_name(self, name):
+        """Return the group of a name, None if unknown"""
+        with self._lock:
+            return self.groups_by_name.get(name)
+
+
+class PrefixIndex(object):
+    """Sorted searchable strings of a listing, for case insensitive prefix searches"""
+
+    def __init__(self, items, keys):
+        """
+        :param items: the listing
+        :param keys: function returning the searchable strings of an item
+        """
+        entries = list()
+        for position, item in enumerate(items):
+            for key in set(keys(item)):
+                entries.append((key.lower(), position))
+        entries.sort()
+        self._items = items
+        self._keys = [key for key, _ in entries]
+        self._positions = [position for _, position in entries]
+
+
+    def search(self, prefix, offset=0, limit=20, where=None):
+        """Return the items having a string starting with a prefix,
+        in the order of their matching strings
+
+        :param prefix: searched prefix, empty to match every item
+        :param offset: number of matching items to skip
+        :param limit: number of matching items to return
+        :param where: optional function filtering the matching items
+        :return: the number of matching items, and the requested ones
+        """
+        if not prefix and where is None:
+            return len(self._items), self._items[offset:offset + limit]
+        prefix = prefix.lower()
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + u'\uffff')
+        seen = set()
+        matches = list()
+        for position in self._positions[start:end]:
+            if position in seen:
+                continue
+            seen.add(position)
+            item = self._items[position]
+            if where is None or where(item):
+                matches.append(item)
+        return len(matches), matches[offset:offset + limit]
+
+
+class MembershipIndex(object):
+    """Members of the groups and projects an operation works on: user ids and
+    usernames with their access levels, read once per group or project and
+    kept up to date on the member writes of the operation"""
+
+    def __init__(self, loader):
+        """
+        :param loader: function returning the member list of a source,
+        called with 'group' or 'project' and its id
+        """
+        self._loader = loader
+        self._by_id = {}
+        self._by_username = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+
+    def load(self, source, source_id):
+        """Read the members of a group or project, once for concurrent callers
+
+        :param source: 'group' or 'project'
+        :param source_id: id of the group or project
+        """
+        key = (source, source_id)
+        with self._lock:
+            if key in self._by_id:
+                return
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._by_id:
+                    return
+            by_id = dict()
+            by_username = dict()
+            for member in self._loader(source, source_id):
+                by_id[member['id']] = (member['username'], member.get('access_level'))
+                by_username[member['username']] = member['id']
+            with self._lock:
+                self._by_id[key] = by_id
+                self._by_username[key] = by_username
+
+
+    def access_level(self, source, source_id, user_id):
+        """Return the access level of a user id in a group or project, None if
+        the user is not a member
+
+        :param source: 'group' or 'project'
+        :param source_id: id of the group or project
+        :param user_id: id of the user
+        """
+        self.load(source, source_id)
+        with self._lock:
+            member = self._by_id[(source, source_id)].get(user_id)
+        return member[1] if member else None
+
+
+    def has_user(self, source, source_id, user_id):
+        """Tell if a user id is a member of a group or project"""
+        self.load(source, source_id)
+        with self._lock:
+            return user_id in self._by_id[(source, source_id)]
+
+
+    def has_username(self, source, source_id, username):
+        """Tell if a username is a member of a group or project"""
+        self.load(source, source_id)
+        with self._lock:
+            return username in self._by_username[(source, source_id)]
+
+
+    def member_with_username(self, source, source_id, username):
+        """Return the member of a group or project with a username, None if not a member
+
+        :return: dictionary with the id, username and access_level of the member
+        """
+        self.load(source, source_id)
+        with self._lock:
+            user_id = self._by_username[(source, source_id)].get(username)
+            if user_id is None:
+                return None
+            return {'id': user_id,
+                    'username': username,
+                    'access_level': self._by_id[(source, source_id)][user_id][1]}
+
+
+    def add(self, source, source_id, user_id, username, access_level):
+        """Record a member added to a group or project, when its members were read"""
+        with self._lock:
+            if (source, source_id) in self._by_id:
+                self._by_id[(source, source_id)][user_id] = (username, access_level)
+                self._by_username[(source, source_id)][username] = user_id
+
+
+    def remove(self, source, source_id, user_id):
+        """Record a member removed from a group or project, when its members were read"""
+        with self._lock:
+            if (source, source_id) in self._by_id:
+                member = self._by_id[(source, source_id)].pop(user_id, None)
+                if member:
+                    self._by_username[(source, source_id)].pop(member[0], None)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+'''
+Flask jobs
+'''
+
+from __future__ import absolute_import
+
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import Queue
+from contextlib import contextmanager
+
+
+class OperationLog(list):
+    """List of the {operation: response} results of a manage call,
+    reporting each operation appended to a callback"""
+
+    def __init__(self, callback=None):
+        """
+        :param callback: function called with each appended operation
+        """
+        super(OperationLog, self).__init__()
+        self.callback = callback
+
+
+    def append(self, operation):
+        """Append an operation and report it"""
+        super(OperationLog, self).append(operation)
+        if self.callback:
+            self.callback(operation)
+
+
+class MemoryJobStore(object):
+    """Job states kept in the memory of the process"""
+
+    def __init__(self, ttl=3600):
+        """
+        :param ttl: seconds a finished job is kept
+        """
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+
+    def create(self, job_id, kind):
+        """Register a queued job of a kind, and forget the expired ones"""
+        now = time.time()
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if job['state'] in ('done', 'failed') and now - job['updated'] > self.ttl:
+                    del self._jobs[key]
+            self._jobs[job_id] = {'id': job_id, 'kind': kind, 'state': 'queued',
+                                  'created': now, 'updated': now, 'operations': [],
+                                  'result': None, 'error': None}
+
+
+    def set_state(self, job_id, state, result=None, error=None):
+        """Update the state of a job, with its result or error once finished"""
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update({'state': state, 'updated': time.time(),
+                        'result': result, 'error': error})
+
+
+    def add_operation(self, job_id, section, operation):
+        """Record an operation done by a job
+
+        :param section: 'manage_project' or 'manage_user_env'
+        :param operation: dictionary {operation: response}
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            for name, response in operation.items():
+                job['operations'].append({'section': section,
+                                          'operation': name,
+                                          'response': response})
+            job['updated'] = time.time()
+
+
+    def get(self, job_id, since=0):
+        """Return a job, with its operations from a position, None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            job['operations'] = job['operations'][since:]
+            return job
+
+
+class SQLiteJobStore(object):
+    """Job states kept in a SQLite database shared by the worker processes of a host"""
+
+    def __init__(self, path, ttl=3600):
+        """
+        :param path: path of the database
+        :param ttl: seconds a finished job is kept
+        """
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs '
+                               '(id TEXT PRIMARY KEY, state TEXT, created REAL, '
+                               'updated REAL, result TEXT, error TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS operations '
+                               '(job_id TEXT, section TEXT, operation TEXT, response TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS operations_job_id '
+                               'ON operations (job_id)')
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            if 'kind' not in columns:
+                connection.execute('ALTER TABLE jobs ADD COLUMN kind TEXT')
+
+
+    @contextmanager
+    def _connect(self):
+        """Yield a new connection in a transaction,
+        connections cannot be shared between threads"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+    def create(self, job_id, kind):
+        """Register a queued job of a kind, and forget the expired ones"""
+        now = time.time()
+        with self._connect() as connection:
+            expired = "SELECT id FROM jobs WHERE state IN ('done', 'failed') AND updated < ?"
+            connection.execute('DELETE FROM operations WHERE job_id IN (%s)' % expired,
+                               (now - self.ttl,))
+            connection.execute("DELETE FROM jobs WHERE state IN ('done', 'failed') "
+                               "AND updated < ?", (now - self.ttl,))
+            connection.execute('INSERT INTO jobs (id, kind, state, created, updated) '
+                               'VALUES (?, ?, ?, ?, ?)', (job_id, kind, 'queued', now, now))
+
+
+    def set_state(self, job_id, state, result=None, error=None):
+        """Update the state of a job, with its result or error once finished"""
+        with self._connect() as connection:
+            connection.execute('UPDATE jobs SET state = ?, updated = ?, result = ?, error = ? '
+                               'WHERE id = ?',
+                               (state, time.time(),
+                                json.dumps(result) if result is not None else None,
+                                error, job_id))
+
+
+    def add_operation(self, job_id, section, operation):
+        """Record an operation done by a job
+
+        :param section: 'manage_project' or 'manage_user_env'
+        :param operation: dictionary {operation: response}
+        """
+        with self._connect() as connection:
+            for name, response in operation.items():
+                connection.execute('INSERT INTO operations VALUES (?, ?, ?, ?)',
+                                   (job_id, section, name, json.dumps(response)))
+            connection.execute('UPDATE jobs SET updated = ? WHERE id = ?',
+                               (time.time(), job_id))
+
+
+    def get(self, job_id, since=0):
+        """Return a job, with its operations from a position, None if unknown"""
+        with self._connect() as connection:
+            row = connection.execute('SELECT id, state, created, updated, result, error, kind '
+                                     'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            operations = connection.execute('SELECT section, operation, response '
+                                            'FROM operations WHERE job_id = ? '
+                                            'ORDER BY rowid LIMIT -1 OFFSET ?',
+                                            (job_id, since)).fetchall()
+        return {'id': row[0], 'kind': row[6], 'state': row[1], 'created': row[2], 'updated': row[3],
+                'result': json.loads(row[4]) if row[4] else None, 'error': row[5],
+                'operations': [{'section': section,
+                                'operation': operation,
+                                'response': json.loads(response)}
+                               for section, operation, response in operations]}
+
+
+class JobQueue(object):
+    """Run jobs on background threads, recording their progress in a store"""
+
+    def __init__(self, store, workers=4):
+        """
+        :param store: MemoryJobStore or SQLiteJobStore
+        :param workers: number of jobs run concurrently
+        """
+        self.store = store
+        self.workers = workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+
+    def _start(self):
+        """Start the worker threads on first use, so that forked processes own theirs"""
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range(self.workers):
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+
+    def _work(self):
+        """Run the queued jobs"""
+        while True:
+            job_id, function = self._queue.get()
+            self.store.set_state(job_id, 'running')
+
+            def progress(section, operation):
+                """Record an operation of the running job"""
+                self.store.add_operation(job_id, section, operation)
+
+            try:
+                result = function(progress)
+            except Exception as error:
+                self.store.set_state(job_id, 'failed', error=str(error))
+            else:
+                self.store.set_state(job_id, 'done', result=result)
+            finally:
+                self._queue.task_done()
+
+
+    def submit(self, function, kind):
+        """Queue a job
+
+        :param function: function of the job, taking a progress(section, operation)
+        callback and returning a JSON serializable result
+        :param kind: kind of the job, like 'result' for the /result submissions
+        :return: the job id
+        """
+        self._start()
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, kind)
+        self._queue.put((job_id, function))
+        return job_id
+
+
+    def drain(self, timeout):
+        """Wait for the queued and running jobs to finish, on shutdown
+
+        :param timeout: maximum seconds to wait
+        :return: True if every job finished
+        """
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+    def get(self, job_id, since=0):
+        """Return the state of a job, None if unknown
+
+        :param job_id: the job id
+        :param since: number of operations already known by the caller
+        """
+        return self.store.get(job_id, since)
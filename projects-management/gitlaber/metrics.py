@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+Flask metrics
+'''
+
+from __future__ import absolute_import
+
+import re
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    """Return the {name="value",...} part of a sample"""
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels)
+
+
+def _format_value(value):
+    """Return a sample value for the Prometheus text format"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def route_template(path):
+    """Return the route template of a GitLab API path, like /projects/:id/members
+
+    :param path: API path or url, like http://gitlab/api/v3/projects/12/members?page=2
+    """
+    path = re.sub(r'^[a-z]+://[^/]+', '', path.split('?')[0])
+    path = re.sub(r'^/api/v\d+', '', path)
+    segments = path.split('/')
+    for position, segment in enumerate(segments):
+        if segment.isdigit() or '%2F' in segment.upper():
+            segments[position] = ':id'
+        elif position > 0 and segments[position - 1] == 'branches':
+            segments[position] = ':branch'
+    return '/'.join(segments)
+
+
+class Counter(object):
+    """Monotonic counter, by label values"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+
+    def inc(self, amount=1, **labels):
+        """Increment the counter of the given label values"""
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def render(self):
+        """Return the lines of the counter in the Prometheus text format"""
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s counter' % self.name]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name,
+                                          _format_labels(zip(self.labels, key)),
+                                          _format_value(value)))
+        return lines
+
+
+class Histogram(object):
+    """Distribution of observed values in cumulative buckets, by label values"""
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value, **labels):
+        """Record a value for the given label values"""
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets),
+                                              'sum': 0.0, 'count': 0}
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][position] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+
+    def render(self):
+        """Return the lines of the histogram in the Prometheus text format"""
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = list(zip(self.labels, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['buckets']):
+                    cumulative += count
+                    lines.append('%s_bucket%s %d' % (self.name,
+                                                     _format_labels(labels + [('le', _format_value(bound))]),
+                                                     cumulative))
+                lines.append('%s_sum%s %s' % (self.name, _format_labels(labels),
+                                              _format_value(series['sum'])))
+                lines.append('%s_count%s %d' % (self.name, _format_labels(labels),
+                                                series['count']))
+        return lines
+
+
+class Registry(object):
+    """Metrics of the process, and collectors of gauges read at exposition time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+
+    def counter(self, name, documentation, labels=()):
+        """Create and register a counter"""
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a histogram"""
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+
+    def collector(self, function):
+        """Register a function returning gauges as a list of
+        (name, documentation, [(labels dictionary, value), ...])"""
+        self._collectors.append(function)
+        return function
+
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for function in self._collectors:
+            for name, documentation, samples in function():
+                lines.append('# HELP %s %s' % (name, documentation))
+                lines.append('# TYPE %s gauge' % name)
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append('%s%s %s' % (name, _format_labels(sorted(labels.items())),
+                                              _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'gitlab_upstream_request_seconds',
+    'Latency of the GitLab API calls',
+    ('method', 'route', 'status'))
+
+DEDUPLICATED_CALLS = REGISTRY.counter(
+    'gitlab_deduplicated_requests_total',
+    'GitLab GET calls answered by an identical call of the same Flask request')
+
+CRAWL_PAGES = REGISTRY.histogram(
+    'gitlab_crawl_pages',
+    'Pages fetched by the listing crawls',
+    ('route',),
+    (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+
+VIEW_LATENCY = REGISTRY.histogram(
+    'flask_view_seconds',
+    'Latency of the Flask views',
+    ('endpoint', 'method', 'status'))
+
+VIEW_UPSTREAM_WAIT = REGISTRY.histogram(
+    'flask_view_gitlab_wait_seconds',
+    'Time the Flask views spent waiting on GitLab',
+    ('endpoint',))
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    'gitlab_rate_limit_wait_seconds',
+    'Time the GitLab calls waited for the client rate limiter')
+
+RETRIES = REGISTRY.counter(
+    'gitlab_retries_total',
+    'GitLab calls retried after a transient error',
+    ('method', 'route', 'reason'))
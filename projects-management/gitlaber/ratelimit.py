@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Flask rate limit
+'''
+
+from __future__ import absolute_import
+
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+
+class TokenBucket(object):
+    """Rate limiter shared by the threads of the process: a call takes a token,
+    tokens come back at a steady rate up to a burst"""
+
+    def __init__(self, rate, burst):
+        """
+        :param rate: tokens per second (0 disables the limit)
+        :param burst: number of tokens the bucket holds
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+
+    def acquire(self):
+        """Take a token, waiting for one, or for the end of a pause
+
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if not self.rate:
+                        return waited
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+    def pause(self, seconds):
+        """Hold every call for a while, when the server asks to slow down"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+
+
+def retry_after(headers):
+    """Return the seconds to wait of a Retry-After header, None if missing
+
+    :param headers: response headers
+    """
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return None
+        return max(mktime_tz(date) - time.time(), 0)
+
+
+def backoff(attempt, base, cap):
+    """Return the delay before a retry, exponential with full jitter
+
+    :param attempt: number of the retry, from 1
+    :param base: delay of the first retry, before jitter
+    :param cap: maximum delay
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
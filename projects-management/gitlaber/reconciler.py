@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+Flask reconciler
+'''
+
+from __future__ import absolute_import
+
+import json
+from collections import OrderedDict
+
+from gitlaber import config
+from gitlaber.batch import Batch
+
+
+def load_desired_state(path):
+    """Read a desired state file, mapping users to environments, which are
+    rows like the ones of the user environment form:
+
+        {
+            "environments": {
+                "default": [{"group": "puppet", "name": "profiles",
+                             "access": "30", "branch": "development"}]
+            },
+            "users": {"jdoe": ["default"]}
+        }
+
+    :param path: path of the JSON file
+    :return: dictionary of the {group, name, access, branch} rows of each username
+    """
+    with open(path) as state_file:
+        state = json.load(state_file)
+    environments = state.get('environments') or {}
+    desired = OrderedDict()
+    for username, names in sorted((state.get('users') or {}).items()):
+        if isinstance(names, basestring):
+            names = [names]
+        rows = list()
+        for name in names:
+            if name not in environments:
+                raise ValueError("Unknown environment {0} of user {1}".format(name, username))
+            for row in environments[name]:
+                if not row.get('group') or not row.get('name'):
+                    raise ValueError("Environment {0} has a row without group or name"
+                                     .format(name))
+                rows.append({'group': row['group'],
+                             'name': row['name'],
+                             'access': str(row.get('access') or ''),
+                             'branch': row.get('branch') or ''})
+        desired[username] = rows
+    return desired
+
+
+class Reconciler(object):
+    """Converge the branches and memberships of users on the projects of a
+    desired state: the current state is read once for every project and
+    group, and only the differences are written, concurrently"""
+
+    def __init__(self, gitlab, desired, prune=False, workers=None):
+        """
+        :param gitlab: Gitlab client, with the token of an admin user
+        :param desired: rows of each username, see load_desired_state
+        :param prune: delete the branches and project memberships of the users
+        on the projects of the desired state which have no row for them. An
+        empty branch or access of a row leaves them alone, like in the form
+        :param workers: number of reads and writes run concurrently
+        (default is BATCH_WORKERS)
+        """
+        self.gitlab = gitlab
+        self.desired = desired
+        self.prune = prune
+        self.workers = workers or config.BATCH_WORKERS
+
+
+    def plan(self, batch):
+        """Read the current state and return the changes reaching the desired one
+
+        :param batch: Batch of the run, holding the members read
+        :return: list of (username, operation, method, args) changes, where
+        method is the name of the Gitlab method sending the write, and the
+        dictionary of the errors by username
+        """
+        gitlab = self.gitlab
+        users = dict((user['username'], user['id']) for user in gitlab.get_all_users())
+        index = gitlab.get_project_index()
+        errors = OrderedDict()
+        projects = OrderedDict()
+        wanted = dict()
+        for username, rows in self.desired.items():
+            if username not in users:
+                errors.setdefault(username, []).append("User {0} not found".format(username))
+            for row in rows:
+                path = row['group'] + "/" + row['name']
+                project = index.project_with_namespace(path)
+                if project is None:
+                    errors.setdefault(username, []).append("Project {0} not found".format(path))
+                    continue
+                projects[project['id']] = (project, row['group'])
+                # A project in several environments of a user takes the first
+                # branch and the first access level given
+                current = wanted.setdefault((username, project['id']), dict(row))
+                current['branch'] = current['branch'] or row['branch']
+                current['access'] = current['access'] or row['access']
+
+        def read_project(project_id):
+            """Return the branch names of a project, read from GitLab rather than
+            from the branch cache, and read its members"""
+            batch.members.load('project', project_id)
+            return set(branch['name'] for branch in
+                       gitlab.get('/projects/{0}/repository/branches'.format(project_id)))
+
+        def read_group(name):
+            """Return the id of a group name, and read its members"""
+            group = gitlab.get_group_with_name(name)
+            if group is None:
+                return None
+            batch.members.load('group', group['id'])
+            return group['id']
+
+        project_ids = list(projects)
+        branches = dict(zip(project_ids, batch.map(read_project, project_ids)))
+        groups = sorted(set(group for _, group in projects.values()))
+        group_ids = dict(zip(groups, batch.map(read_group, groups)))
+
+        changes = list()
+        for username, user_id in sorted((x, users[x]) for x in self.desired if x in users):
+            for project_id in project_ids:
+                project, group = projects[project_id]
+                row = wanted.get((username, project_id))
+                branch_url = '/projects/{0}/repository/branches'.format(project_id)
+                member_url = '/projects/{0}/members'.format(project_id)
+
+                if row and row['branch']:
+                    if username not in branches[project_id]:
+                        changes.append((username,
+                                        "create branch {0} in project {1}".format(
+                                            username, project['name']),
+                                        'post',
+                                        (branch_url, {"id":project_id,
+                                                      "branch_name":username,
+                                                      "ref":row['branch']})))
+                elif self.prune and row is None and username in branches[project_id]:
+                    changes.append((username,
+                                    "delete branch {0} in project {1}".format(
+                                        username, project['name']),
+                                    'delete',
+                                    ('{0}/{1}'.format(branch_url, username),)))
+
+                level = batch.members.access_level('project', project_id, user_id)
+                if row and row['access']:
+                    in_group = group_ids[group] is not None \
+                        and batch.members.has_username('group', group_ids[group], username)
+                    if not in_group and level is None:
+                        changes.append((username,
+                                        "create member {0} on project {1}".format(
+                                            username, project['name']),
+                                        'post',
+                                        (member_url, {"id":project_id,
+                                                      "user_id":user_id,
+                                                      "access_level":row['access']})))
+                    elif not in_group and str(level) != row['access']:
+                        changes.append((username,
+                                        "update member {0} on project {1}".format(
+                                            username, project['name']),
+                                        'put',
+                                        ('{0}/{1}'.format(member_url, user_id),
+                                         {"access_level":row['access']})))
+                elif self.prune and row is None and level is not None:
+                    changes.append((username,
+                                    "delete member {0} on project {1}".format(
+                                        username, project['name']),
+                                    'delete',
+                                    ('{0}/{1}'.format(member_url, user_id),)))
+        return changes, errors
+
+
+    def run(self, dry_run=False, progress=None):
+        """Plan the changes and apply them
+
+        :param dry_run: only plan the changes
+        :param progress: optional function called with each operation done
+        :return: dictionary of the operations by username
+        """
+        # The current state is read from GitLab, like the branches
+        batch = Batch(self.gitlab, self.workers, members_max_age=0)
+        changes, errors = self.plan(batch)
+        report = OrderedDict()
+        for username, messages in errors.items():
+            report[username] = [{"Error": message} for message in messages]
+
+        def write(change):
+            """Send a change, returning its operation result"""
+            _, operation, method, args = change
+            try:
+                done = {operation: getattr(self.gitlab, method)(*args)}
+            except StandardError as error:
+                done = {"Error": "{0}: {1}".format(operation, error)}
+            if progress:
+                progress(done)
+            return done
+
+        if dry_run:
+            results = [{operation: "Planned"} for _, operation, _, _ in changes]
+        else:
+            results = batch.map(write, changes)
+        for change, done in zip(changes, results):
+            report.setdefault(change[0], []).append(done)
+        return report
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+'''
+Flask records
+'''
+
+from __future__ import absolute_import
+
+
+class Record(object):
+    """Compact item of a cached listing, keeping only the fields read by the
+    views and the indexes, and read like the dictionary it is projected from"""
+
+    __slots__ = ()
+    fields = ()
+    # Path of the full object, fetched on demand
+    resource = None
+
+    def __init__(self, *values):
+        for field, value in zip(self.fields, values):
+            setattr(self, field, value)
+
+
+    @classmethod
+    def from_item(cls, item):
+        """Project a dictionary of the API, or return a record as is
+
+        :param item: dictionary of the API, or record
+        """
+        if isinstance(item, cls):
+            return item
+        return cls(*[item.get(field) for field in cls.fields])
+
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+    def get(self, key, default=None):
+        """Return a field like dict.get"""
+        if key not in self.fields:
+            return default
+        return getattr(self, key)
+
+
+    def __contains__(self, key):
+        return key in self.fields
+
+
+    def keys(self):
+        """Return the field names, so that dict(record) works"""
+        return list(self.fields)
+
+
+    def as_dict(self):
+        """Return the record as a dictionary, for JSON"""
+        return dict((field, value.as_dict() if isinstance(value, Record) else value)
+                    for field, value in ((field, getattr(self, field))
+                                         for field in self.fields))
+
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__,
+                                 ', '.join('{0}={1!r}'.format(field, getattr(self, field))
+                                           for field in self.fields))
+
+
+class User(Record):
+    """User of the /users listing"""
+
+    __slots__ = fields = ('id', 'username', 'name')
+    resource = '/users'
+
+
+class Group(Record):
+    """Group of the /groups listing"""
+
+    __slots__ = fields = ('id', 'name')
+    resource = '/groups'
+
+
+class Namespace(Record):
+    """Namespace of a project"""
+
+    __slots__ = fields = ('id', 'name')
+    resource = '/namespaces'
+
+
+class Project(Record):
+    """Project of the /projects/all listing"""
+
+    __slots__ = fields = ('id', 'name', 'path_with_namespace', 'namespace', 'last_activity_at')
+    resource = '/projects'
+
+    @classmethod
+    def from_item(cls, item):
+        """Project a dictionary of the API, or return a record as is
+
+        :param item: dictionary of the API, or record
+        """
+        if isinstance(item, cls):
+            return item
+        return cls(item.get('id'), item.get('name'), item.get('path_with_namespace'),
+                   Namespace.from_item(item.get('namespace') or {}),
+                   item.get('last_activity_at'))
+
+
+# Record of the items of each listing
+LISTING_RECORDS = {
+    '/users': User,
+    '/groups': Group,
+    '/projects/all': Project,
+}
+
+
+def project(rpath, item):
+    """Return the record of an item of a listing
+
+    :param rpath: Relative resource path of the listing, like '/users'
+    :param item: dictionary of the API, or record
+    """
+    return LISTING_RECORDS[rpath].from_item(item)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+'''
+Flask snapshot
+'''
+
+from __future__ import absolute_import
+
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+
+from gitlaber import records
+
+# Listing paths, their table, and the indexed columns of their items
+LISTING_TABLES = {
+    '/users': ('users', (('username', lambda user: user['username']),)),
+    '/groups': ('groups', ()),
+    '/projects/all': ('projects', (('path_with_namespace',
+                                    lambda project: project['path_with_namespace']),
+                                   ('namespace',
+                                    lambda project: project['namespace']['name']))),
+}
+
+
+class SnapshotStore(object):
+    """Users, groups, projects, branches and members kept in a SQLite database
+    shared by the worker processes of a host, and surviving their restarts"""
+
+    def __init__(self, path):
+        """
+        :param path: path of the database
+        """
+        self.path = path
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS listings '
+                               '(rpath TEXT PRIMARY KEY, updated REAL)')
+            for table, columns in LISTING_TABLES.values():
+                connection.execute('CREATE TABLE IF NOT EXISTS {0} '
+                                   '(id INTEGER PRIMARY KEY, name TEXT, {1}data TEXT)'
+                                   .format(table, ''.join('{0} TEXT, '.format(column)
+                                                          for column, _ in columns)))
+                for column, _ in columns:
+                    connection.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'
+                                       .format(table, column))
+            connection.execute('CREATE TABLE IF NOT EXISTS branches '
+                               '(project_id INTEGER, name TEXT, updated REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS branches_project_id '
+                               'ON branches (project_id)')
+            connection.execute('CREATE TABLE IF NOT EXISTS branch_events '
+                               '(project_id INTEGER, at REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS branch_events_at '
+                               'ON branch_events (at)')
+            connection.execute('CREATE TABLE IF NOT EXISTS members '
+                               '(source TEXT, source_id INTEGER, username TEXT, '
+                               'data TEXT, updated REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS members_source '
+                               'ON members (source, source_id)')
+            connection.execute('CREATE INDEX IF NOT EXISTS members_username '
+                               'ON members (username)')
+            connection.execute('CREATE TABLE IF NOT EXISTS member_sources '
+                               '(source TEXT, source_id INTEGER, updated REAL, '
+                               'PRIMARY KEY (source, source_id))')
+
+
+    @contextmanager
+    def _connect(self):
+        """Yield a new connection in a transaction,
+        connections cannot be shared between threads"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+    def save_listing(self, rpath, items):
+        """Replace a stored listing
+
+        :param rpath: Relative resource path, like '/users'
+        :param items: the record list of the resource
+        """
+        with self._connect() as connection:
+            connection.execute('DELETE FROM {0}'.format(LISTING_TABLES[rpath][0]))
+            self._insert(connection, rpath, items)
+            connection.execute('INSERT OR REPLACE INTO listings VALUES (?, ?)',
+                               (rpath, time.time()))
+
+
+    def update_listing(self, rpath, items):
+        """Add or replace items of a stored listing, synced up to now
+
+        :param rpath: Relative resource path, like '/projects/all'
+        :param items: the changed records of the resource
+        """
+        with self._connect() as connection:
+            self._insert(connection, rpath, items)
+            connection.execute('INSERT OR REPLACE INTO listings VALUES (?, ?)',
+                               (rpath, time.time()))
+
+
+    def _insert(self, connection, rpath, items):
+        """Insert or replace items of a listing"""
+        table, columns = LISTING_TABLES[rpath]
+        items = [records.project(rpath, item) for item in items]
+        rows = [[item['id'], item['name']] + [key(item) for _, key in columns]
+                + [json.dumps(item.as_dict())] for item in items]
+        connection.executemany('INSERT OR REPLACE INTO {0} VALUES ({1})'
+                               .format(table, ', '.join('?' * (len(columns) + 3))),
+                               rows)
+
+
+    def patch_listing(self, rpath, item=None, remove_id=None):
+        """Add, replace or remove one item of a stored listing
+
+        :param rpath: Relative resource path, like '/projects/all'
+        :param item: item to add or replace
+        :param remove_id: id of the item to remove
+        """
+        with self._connect() as connection:
+            if item:
+                self._insert(connection, rpath, [item])
+            else:
+                connection.execute('DELETE FROM {0} WHERE id = ?'
+                                   .format(LISTING_TABLES[rpath][0]), (remove_id,))
+
+
+    def load_listing(self, rpath, max_age=None):
+        """Return the records of a stored listing sorted by name, and the time it was stored
+
+        :param rpath: Relative resource path, like '/users'
+        :param max_age: seconds after which a stored listing is ignored
+        :return: (items, updated), None if missing or too old
+        """
+        table, _ = LISTING_TABLES[rpath]
+        with self._connect() as connection:
+            row = connection.execute('SELECT updated FROM listings WHERE rpath = ?',
+                                     (rpath,)).fetchone()
+            if row is None or (max_age is not None and time.time() - row[0] >= max_age):
+                return None
+            items = connection.execute('SELECT data FROM {0} ORDER BY name'
+                                       .format(table)).fetchall()
+        return [records.project(rpath, json.loads(data)) for data, in items], row[0]
+
+
+    def project_with_namespace(self, path_with_namespace, max_age=None):
+        """Return the stored project of a path like mygroup/myproject
+
+        :param path_with_namespace: mygroup/myproject
+        :param max_age: seconds after which the stored project listing is ignored
+        :return: the project record, None if unknown or too old
+        """
+        with self._connect() as connection:
+            updated = connection.execute('SELECT updated FROM listings WHERE rpath = ?',
+                                         ('/projects/all',)).fetchone()
+            if updated is None or (max_age is not None and time.time() - updated[0] >= max_age):
+                return None
+            row = connection.execute('SELECT data FROM projects WHERE path_with_namespace = ?',
+                                     (path_with_namespace,)).fetchone()
+        return records.project('/projects/all', json.loads(row[0])) if row else None
+
+
+    def save_branches(self, project_id, names):
+        """Replace the stored branch names of a project"""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('DELETE FROM branches WHERE project_id = ?', (project_id,))
+            connection.executemany('INSERT INTO branches VALUES (?, ?, ?)',
+                                   [(project_id, name, now) for name in names])
+
+
+    def load_branches(self, project_id, max_age=None):
+        """Return the stored branch names of a project, None if missing or too old"""
+        with self._connect() as connection:
+            rows = connection.execute('SELECT name, updated FROM branches '
+                                      'WHERE project_id = ? ORDER BY rowid',
+                                      (project_id,)).fetchall()
+        if not rows or (max_age is not None and time.time() - rows[0][1] >= max_age):
+            return None
+        return [name for name, _ in rows]
+
+
+    def forget_branches(self, project_id):
+        """Drop the stored branches of a project, after a write changed them"""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM branches WHERE project_id = ?', (project_id,))
+
+
+    def record_branch_event(self, project_id, keep=86400):
+        """Record that the branches of a project changed, for the other processes
+
+        :param project_id: id of the project
+        :param keep: seconds after which the events are dropped
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('DELETE FROM branch_events WHERE at < ?', (now - keep,))
+            connection.execute('INSERT INTO branch_events VALUES (?, ?)', (project_id, now))
+
+
+    def branch_events(self, since):
+        """Return the ids of the projects whose branches changed since a time,
+        and the time of the last event
+
+        :param since: time of the last event seen
+        :return: (project ids, time of the last event)
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT project_id, at FROM branch_events WHERE at > ?',
+                                      (since,)).fetchall()
+        return set(project_id for project_id, _ in rows), max([since] + [at for _, at in rows])
+
+
+    def save_members(self, source, source_id, members):
+        """Replace the stored members of a project or a group
+
+        :param source: 'project' or 'group'
+        :param source_id: id of the project or group
+        :param members: dictionary list of the members
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('DELETE FROM members WHERE source = ? AND source_id = ?',
+                               (source, source_id))
+            connection.executemany('INSERT INTO members VALUES (?, ?, ?, ?, ?)',
+                                   [(source, source_id, member['username'],
+                                     json.dumps(member), now) for member in members])
+            connection.execute('INSERT OR REPLACE INTO member_sources VALUES (?, ?, ?)',
+                               (source, source_id, now))
+
+
+    def load_members(self, source, source_id, max_age=None):
+        """Return the stored members of a project or a group, None if missing or too old
+
+        :param source: 'project' or 'group'
+        :param source_id: id of the project or group
+        :param max_age: seconds after which the stored members are ignored
+        """
+        with self._connect() as connection:
+            row = connection.execute('SELECT updated FROM member_sources '
+                                     'WHERE source = ? AND source_id = ?',
+                                     (source, source_id)).fetchone()
+            if row is None or (max_age is not None and time.time() - row[0] >= max_age):
+                return None
+            rows = connection.execute('SELECT data FROM members '
+                                      'WHERE source = ? AND source_id = ? ORDER BY rowid',
+                                      (source, source_id)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+
+    def forget_members(self, source, source_id):
+        """Drop the stored members of a project or a group, after a write changed them"""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM members WHERE source = ? AND source_id = ?',
+                               (source, source_id))
+            connection.execute('DELETE FROM member_sources WHERE source = ? AND source_id = ?',
+                               (source, source_id))
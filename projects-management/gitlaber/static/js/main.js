@@ -123,9 +123,16 @@ $(document).ready(function() {
             type: 'post',
             url: actionurl,
             data: data,
-            success : function(data){
-                $("#result").html(data);
-                $("#reset").trigger("click");
+            success : function(data, textStatus, jqXHR){
+                if (jqXHR.status == 202 && data.job_id) {
+                    // The submission runs in background, follow its progress
+                    $("#result").empty();
+                    pollJob(data, 0);
+                } else {
+                    $("#result").html(data);
+                    $("#reset").trigger("click");
+                    hideLoading();
+                }
             },
             error: function(jqXHR,error, errorThrown) {  
                 if(jqXHR.status&&jqXHR.status==400){
@@ -133,14 +140,46 @@ $(document).ready(function() {
                 }else{
                    alert("Something went wrong");
                 }
-            },
-            complete: function(){
-                $('#loading-bk').css('display', 'none');
-                $('#loading').css('display', 'none');
+                hideLoading();
             }
         });
     });
 
+    function hideLoading() {
+        $('#loading-bk').css('display', 'none');
+        $('#loading').css('display', 'none');
+    }
+
+    function pollJob(job, since) {
+        $.ajax({
+            url: job.status_url,
+            type: 'GET',
+            data: {'since': since},
+            dataType: 'json',
+            success: function(status){
+                $.each(status.operations, function(index, value){
+                    var operation = $('<div class="alert alert-info" role="alert"></div>');
+                    operation.append($('<b></b>').text(value.operation + ':'));
+                    operation.append(document.createTextNode(' ' + JSON.stringify(value.response)));
+                    $("#result").append(operation);
+                });
+                since += status.operations.length;
+                if (status.state == "done" || status.state == "failed") {
+                    $.get(job.result_url, function(data){
+                        $("#result").html(data);
+                        $("#reset").trigger("click");
+                    }).always(hideLoading);
+                } else {
+                    setTimeout(function(){ pollJob(job, since); }, 1000);
+                }
+            },
+            error: function() {
+                alert("Something went wrong");
+                hideLoading();
+            }
+        });
+    }
+
     var jsonDefaultEnv =
     [
         {
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+'''
+Flask transport
+'''
+
+from __future__ import absolute_import
+
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask_oauthlib.client import prepare_request
+
+
+class PooledResponse(object):
+    """Response of the pooled transport, with the attributes
+    flask_oauthlib reads on urllib2 responses"""
+
+    def __init__(self, response):
+        """
+        :param response: requests response
+        """
+        self.code = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+
+
+class StoredResponse(object):
+    """Response of a GET request kept to answer its conditional requests"""
+
+    def __init__(self, response, content):
+        """
+        :param response: pooled response
+        :param content: content of the response
+        """
+        self.code = response.code
+        self.headers = response.headers
+        self.url = response.url
+        self.content = content
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+
+class PooledTransport(object):
+    """HTTP transport keeping connections alive in a pool per host,
+    shared by every thread of the process"""
+
+    def __init__(self, pool_connections=4, pool_maxsize=16, keep_alive=True,
+                 connect_timeout=5, read_timeout=60, conditional_entries=0):
+        """
+        :param pool_connections: number of host pools kept
+        :param pool_maxsize: number of connections kept per host
+        :param keep_alive: keep connections open between requests
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait for a response
+        :param conditional_entries: number of GET responses kept to send conditional
+        requests with their ETag or Last-Modified date (0 disables it)
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.adapter = HTTPAdapter(pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self._active = 0
+        self._lock = threading.Lock()
+        self.conditional_entries = conditional_entries
+        self._stored = OrderedDict()
+        self._revalidation = {'hits': 0, 'misses': 0}
+
+
+    def http_request(self, uri, headers=None, data=None, method=None):
+        """Send a request, with the signature of OAuthRemoteApp.http_request
+
+        :return: the response and its content
+        """
+        uri, headers, data, method = prepare_request(uri, headers, data, method)
+        conditional = method == 'GET' and self.conditional_entries > 0
+        if conditional:
+            # Responses depend on the token, so is the stored one
+            key = (uri, headers.get('Authorization'))
+            stored = self._get_stored(key)
+            if stored:
+                headers = dict(headers)
+                if stored.etag:
+                    headers['If-None-Match'] = stored.etag
+                if stored.last_modified:
+                    headers['If-Modified-Since'] = stored.last_modified
+
+        with self._lock:
+            self._active += 1
+        try:
+            response = self.session.request(method, uri, headers=headers,
+                                            data=data, timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+        if conditional and stored:
+            with self._lock:
+                if response.status_code == 304:
+                    self._revalidation['hits'] += 1
+                else:
+                    self._revalidation['misses'] += 1
+            if response.status_code == 304:
+                return stored, stored.content
+
+        result = PooledResponse(response)
+        if conditional and response.status_code == 200:
+            self._store(key, StoredResponse(result, response.content))
+        return result, response.content
+
+
+    def _get_stored(self, key):
+        """Return the stored response of a key, None if missing"""
+        with self._lock:
+            stored = self._stored.pop(key, None)
+            if stored is not None:
+                self._stored[key] = stored
+            return stored
+
+
+    def _store(self, key, stored):
+        """Store a response which can be revalidated, evicting the least recently used"""
+        if not stored.etag and not stored.last_modified:
+            return
+        with self._lock:
+            self._stored.pop(key, None)
+            self._stored[key] = stored
+            while len(self._stored) > self.conditional_entries:
+                self._stored.popitem(last=False)
+
+
+    def forget_stored(self):
+        """Drop the stored responses, so that the next requests are not conditional"""
+        with self._lock:
+            self._stored.clear()
+
+
+    def revalidation_stats(self):
+        """Return the hits (304 responses) and misses of the conditional requests
+
+        :return: dictionary of counters
+        """
+        with self._lock:
+            result = dict(self._revalidation)
+            result['entries'] = len(self._stored)
+            return result
+
+
+    def stats(self):
+        """Return the open, idle and reused connections of each host pool
+
+        :return: dictionary of stats by host
+        """
+        result = dict()
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            idle = len([conn for conn in list(pool.pool.queue) if conn is not None])
+            result['{0}://{1}:{2}'.format(pool.scheme, pool.host, pool.port)] = {
+                'created': pool.num_connections,
+                'idle': idle,
+                'requests': pool.num_requests,
+                'reused': pool.num_requests - pool.num_connections
+            }
+        with self._lock:
+            active = self._active
+        return {'active': active, 'open': active + sum(x['idle'] for x in result.values()),
+                'hosts': result}
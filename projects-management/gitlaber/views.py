@@ -4,34 +4,112 @@ Flask views
 '''
 from __future__ import absolute_import
 
-from functools import wraps
+from functools import wraps, partial
+import os
+import hmac
 import json
+import time
 
 from flask import Blueprint, render_template, request,\
                   make_response, jsonify, redirect,\
-                  url_for, session
+                  url_for, session, g, current_app,\
+                  Response, stream_with_context, send_from_directory
 
 from gitlaber import controllers
 from gitlaber import config
+from gitlaber import metrics
+from gitlaber.assets import AssetManifest
+from gitlaber.async_client import AsyncGitlab, gather
+from gitlaber.jobs import JobQueue, MemoryJobStore, SQLiteJobStore
+from gitlaber.warmer import WARMER
 
 view = Blueprint("view", __name__)
+
+# Searchable resources: listing path and fields returned
+SEARCHABLE = {
+    "users": ('/users', ('id', 'username', 'name')),
+    "groups": ('/groups', ('id', 'name')),
+    "projects": ('/projects/all', ('id', 'name', 'path_with_namespace'))
+}
 gitlab = controllers.Gitlab(session)
+gitlab_async = AsyncGitlab(gitlab)
+
+if config.JOBS_STORE == 'memory':
+    job_queue = JobQueue(MemoryJobStore(config.JOBS_TTL), config.JOBS_WORKERS)
+else:
+    job_queue = JobQueue(SQLiteJobStore(config.JOBS_STORE, config.JOBS_TTL), config.JOBS_WORKERS)
+
+asset_manifest = AssetManifest(os.path.join(os.path.dirname(__file__), 'static'),
+                               config.ASSETS_DIST)
+
+def stream_template(template_name, **context):
+    """Render a template as a stream of chunks, sent while its context is iterated"""
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(config.INDEX_STREAM_BUFFER)
+    return stream
+
 
 def login_required(function):
-    """Authentication checker"""
+    """Authentication checker, of an admin user: the cached listings are
+    crawled with the token of any admin and shared by the sessions"""
     @wraps(function)
     def decorated_function(*args, **kwargs):
-        """Redirect to the login page if user is not logged"""
-        if not session.get("access_token", False):
+        """Redirect to the login page if user is not logged as an admin"""
+        if not session.get("access_token", False) or not session.get("is_admin", False):
             return redirect(url_for('.user_sessions', next=request.url))
         return function(*args, **kwargs)
     return decorated_function
 
 
+@view.before_app_request
+def start_timer():
+    """Remember when the request started"""
+    g.view_start = time.time()
+
+
+@view.after_app_request
+def record_view_latency(response):
+    """Record the latency of the view, and its time spent waiting on GitLab,
+    once the body is sent for the streamed responses"""
+    endpoint = request.endpoint or 'unknown'
+    method = request.method
+    start = getattr(g, 'view_start', None)
+    calls = getattr(g, 'gitlab_calls', None)
+
+    def record():
+        """Record the metrics of the view"""
+        if start is not None:
+            metrics.VIEW_LATENCY.observe(time.time() - start,
+                                         endpoint=endpoint,
+                                         method=method,
+                                         status=response.status_code)
+        metrics.VIEW_UPSTREAM_WAIT.observe(calls.wait if calls else 0.0, endpoint=endpoint)
+
+    if response.is_streamed:
+        response.call_on_close(record)
+    else:
+        record()
+    return response
+
+
+@view.after_app_request
+def gitlab_calls_header(response):
+    """Report the upstream GitLab calls of the request, and the deduplicated ones.
+    The headers of a streamed response are sent before its body, so only the
+    calls made until then are counted, flagged as partial"""
+    calls = getattr(g, 'gitlab_calls', None)
+    if config.GITLAB_CALLS_HEADER and calls:
+        response.headers['X-Gitlab-Calls'] = 'upstream={0}; deduplicated={1}{2}'.format(
+            calls.upstream, calls.deduplicated, '; partial' if response.is_streamed else '')
+    return response
+
+
 @view.route('/logout')
 def logout():
     """Logout and remove session token"""
     session.pop('access_token', None)
+    session.pop('is_admin', None)
     return redirect(url_for('.user_sessions'))
 
 
@@ -67,6 +145,7 @@ def authorized():
         )
     session['access_token'] = (resp['access_token'], '')
     user = gitlab.get('/user')
+    session['is_admin'] = bool(user['is_admin'])
     if user['is_admin']:
         next_url = request.args.get("next", None)
         if next_url:
@@ -74,6 +153,7 @@ def authorized():
         else:
             return "not logged"
     else:
+        session.pop('access_token', None)
         return make_response(jsonify({'error': 'Unauthorized access'}), 401)
 
 
@@ -85,13 +165,27 @@ def index():
     The main page
     """
     current_user = gitlab.get('/user')
+    if config.INDEX_STREAMING:
+        # Send the page shell at once, then the options as the listings arrive.
+        # Listings are sorted once cached, in GitLab order while first crawled.
+        # The page does not render the projects, which are not crawled.
+        return Response(stream_with_context(
+            stream_template('index.html',
+                            gitlab_url=config.GITLAB_URL,
+                            current_user=current_user,
+                            users=gitlab.iter_listing('/users'),
+                            project_groups=gitlab.iter_listing('/groups'),
+                            projects_groups=gitlab.iter_listing('/groups')
+                           )))
+    # Crawl the listings missing from the cache at the same time
+    users, groups = gather(gitlab_async.get_listing('/users'),
+                           gitlab_async.get_listing('/groups'))
     return render_template('index.html',
                            gitlab_url=config.GITLAB_URL,
                            current_user=current_user,
-                           users=gitlab.get_all_users(),
-                           projects=gitlab.get_all_projects(),
-                           project_groups=gitlab.get_all_groups(),
-                           projects_groups=gitlab.get_all_groups()
+                           users=users,
+                           project_groups=groups,
+                           projects_groups=groups
                           )
 
 
@@ -101,11 +195,81 @@ def health():
     Health page to ensure the app goodness
     """
     response = {
-        "health": "Good doctor!"
+        "health": "Good doctor!",
+        "cache": gitlab.cache.stats(),
+        "branch_cache": gitlab.branches.stats(),
+        "pagination": controllers.PAGINATION_STATS,
+        "project_sync": controllers.PROJECT_SYNC,
+        "pool": gitlab.transport.stats(),
+        "revalidation": gitlab.transport.revalidation_stats(),
+        "warmer": WARMER.stats()
     }
     return jsonify(response), 200
 
 
+@view.app_context_processor
+def asset_helpers():
+    """
+    Template helpers: asset_url('css/main.css') returns the url of the built
+    asset in production when build_assets.py was run, of the source file otherwise
+    """
+    built = current_app.config.get('BUILT_ASSETS', False)
+
+    def asset_url(name):
+        """Return the url of an asset"""
+        if built:
+            name = asset_manifest.filename(name)
+        return url_for('static', filename=name)
+    return {"asset_url": asset_url, "assets_built": built and bool(asset_manifest)}
+
+
+@view.route('/static/{0}/<path:filename>'.format(config.ASSETS_DIST), methods=['GET'])
+def built_asset(filename):
+    """
+    Built assets, named by their content hash so cached for good by the
+    clients, sent precompressed when the client accepts it
+    """
+    if not current_app.config.get('BUILT_ASSETS', False):
+        return make_response(jsonify({'error': 'Built assets are served in production only'}), 404)
+    sent, encoding = asset_manifest.variant(filename, request.headers.get('Accept-Encoding'))
+    response = send_from_directory(asset_manifest.folder, sent,
+                                   mimetype=asset_manifest.mimetype(filename),
+                                   cache_timeout=config.ASSETS_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age={0}, immutable'.format(config.ASSETS_MAX_AGE)
+    return response
+
+
+@view.route('/metrics', methods=['GET'])
+def metrics_page():
+    """
+    Prometheus metrics of the upstream GitLab calls and of the views
+    """
+    response = make_response(metrics.REGISTRY.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+    return response
+
+
+@view.route('/hooks/gitlab', methods=['POST'])
+def gitlab_hook():
+    """
+    Receiver of the push and system hooks of GitLab, keeping the cached
+    branches up to date. Hooks are authenticated by their X-Gitlab-Token
+    secret token, the endpoint is disabled without GITLAB_WEBHOOK_TOKEN.
+    """
+    if not config.GITLAB_WEBHOOK_TOKEN:
+        return make_response(jsonify({'error': 'Hooks disabled'}), 404)
+    token = request.headers.get('X-Gitlab-Token', '').encode('utf-8')
+    if not hmac.compare_digest(token, config.GITLAB_WEBHOOK_TOKEN.encode('utf-8')):
+        return make_response(jsonify({'error': 'Unauthorized access'}), 401)
+    event = request.get_json(silent=True)
+    if not isinstance(event, dict):
+        return make_response(jsonify({'error': 'Expected a JSON object'}), 400)
+    return jsonify({"project_id": gitlab.apply_hook(event)}), 200
+
+
 @view.route('/data', methods=['GET'])
 @login_required
 def data():
@@ -117,11 +281,9 @@ def data():
     if request_type and request_type in allowed_func:
 
         if request_type == "projects":
-            projects = gitlab.get_all_projects()
             myprojects = list()
-            for project in projects:
-                if project['namespace']['name'] == path:
-                    myprojects.append(project['name'])
+            for project in gitlab.get_projects_in_group(path):
+                myprojects.append(project['name'])
 
             return json.dumps(myprojects)
 
@@ -176,14 +338,138 @@ def result():
         else:
             env_action = ""
 
-        return render_template('result.html',
-                               manage_project=gitlab.manage_project(user,
-                                                                    project_name,
-                                                                    project_group,
-                                                                    project_access_level,
-                                                                    project_action,
-                                                                    import_url,
-                                                                    del_user_project
-                                                                   ),
-                               manage_user_env=gitlab.manage_user_env(user, projects, env_action)
-                              )
+        def manage(progress):
+            """Run the submission, reporting each operation"""
+            return {
+                'manage_project': gitlab.manage_project(user,
+                                                        project_name,
+                                                        project_group,
+                                                        project_access_level,
+                                                        project_action,
+                                                        import_url,
+                                                        del_user_project,
+                                                        partial(progress, 'manage_project')
+                                                       ),
+                'manage_user_env': gitlab.manage_user_env(user,
+                                                          projects,
+                                                          env_action,
+                                                          partial(progress, 'manage_user_env')
+                                                         )
+            }
+
+        if config.JOBS_ENABLED:
+            job_id = job_queue.submit(gitlab.bind(manage), 'result')
+            response = {
+                "job_id": job_id,
+                "status_url": url_for('.job_status', job_id=job_id),
+                "result_url": url_for('.job_result', job_id=job_id)
+            }
+            return jsonify(response), 202
+
+        return render_template('result.html', **manage(lambda section, operation: None))
+
+
+@view.route('/api/environments', methods=['POST'])
+@login_required
+def environments():
+    """
+    Bulk user environments endpoint, for N users on M projects:
+    {"users": ["username,id", ...], "projects": [{"group", "name", "access", "branch"}, ...],
+     "action": "create" or "delete"}
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        users = list()
+        for user in payload["users"]:
+            if isinstance(user, dict):
+                users.append((str(user["username"]), int(user["id"])))
+            else:
+                users.append((str(user.split(",")[0]), int(user.split(",")[1])))
+        projects = list()
+        for project in payload["projects"]:
+            projects.append({
+                "group": project["group"],
+                "name": project["name"],
+                "access": project.get("access", ""),
+                "branch": project.get("branch", "")
+            })
+        env_action = payload["action"]
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        env_action = None
+    if env_action not in ("create", "delete"):
+        error = 'Expected {"users": [...], "projects": [...], "action": "create" or "delete"}'
+        return make_response(jsonify({'error': error}), 400)
+
+    def manage(progress):
+        """Run the bulk submission, reporting each operation"""
+        return gitlab.manage_users_env(users, projects, env_action,
+                                       partial(progress, 'manage_users_env'))
+
+    if config.JOBS_ENABLED:
+        job_id = job_queue.submit(gitlab.bind(manage), 'environments')
+        response = {
+            "job_id": job_id,
+            "status_url": url_for('.job_status', job_id=job_id)
+        }
+        return jsonify(response), 202
+
+    return jsonify(manage(lambda section, operation: None))
+
+
+@view.route('/api/users', methods=['GET'], defaults={'resource': 'users'})
+@view.route('/api/groups', methods=['GET'], defaults={'resource': 'groups'})
+@view.route('/api/projects', methods=['GET'], defaults={'resource': 'projects'})
+@login_required
+def search(resource):
+    """
+    Paginated prefix search of users, groups or projects, for typeahead fields:
+    ?q=prefix&page=1&per_page=20, and &group=name for projects
+    """
+    rpath, fields = SEARCHABLE[resource]
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 20, type=int), 1), 100)
+    total, items = gitlab.search_listing(rpath,
+                                         request.args.get("q", ""),
+                                         page,
+                                         per_page,
+                                         request.args.get("group", None))
+    results = list()
+    for item in items:
+        result = dict((field, item[field]) for field in fields)
+        if resource == "projects":
+            result["group"] = item["namespace"]["name"]
+        results.append(result)
+    response = {
+        "items": results,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "next_page": page + 1 if page * per_page < total else None
+    }
+    return jsonify(response)
+
+
+@view.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Job progress endpoint, polled with the number of operations already received"""
+    job = job_queue.get(job_id, request.args.get("since", 0, type=int))
+    if job is None:
+        return make_response(jsonify({'error': 'Job not found'}), 404)
+    return jsonify(job)
+
+
+@view.route('/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def job_result(job_id):
+    """Job result endpoint of the /result submissions, rendered once the job is finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return make_response(jsonify({'error': 'Job not found'}), 404)
+    if job['kind'] != 'result':
+        return make_response(jsonify({'error': 'Job has no result page, see its status'}), 404)
+    if job['state'] == 'failed':
+        return render_template('result.html', manage_project=[{"Error": job['error']}])
+    if job['state'] != 'done':
+        return make_response(jsonify({'error': 'Job not finished'}), 409)
+    return render_template('result.html', **job['result'])
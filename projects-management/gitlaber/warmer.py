@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+'''
+Flask warmer
+'''
+
+from __future__ import absolute_import
+
+import time
+import fcntl
+import random
+import threading
+
+from gitlaber import config
+from gitlaber.controllers import Gitlab
+
+
+class CacheWarmer(object):
+    """Crawl the listings again on a background thread before they expire,
+    so that the requests are served from the cache"""
+
+    def __init__(self, token, listings, interval=240, jitter=30, lock_path=None):
+        """
+        :param token: OAuth token of an admin user, seeing every listed resource
+        :param listings: relative paths of the refreshed listings, like '/users'
+        :param interval: seconds between two refreshes
+        :param jitter: maximum random seconds added to the interval, so that
+        the processes of a host do not refresh at the same time
+        :param lock_path: path of a file locked by the process refreshing the
+        listings, so that one worker process of a host crawls them
+        """
+        self.gitlab = Gitlab({'access_token': (token, '')})
+        self.listings = listings
+        self.interval = interval
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = dict((rpath, {'last_refresh': None,
+                                    'duration': None,
+                                    'items': None,
+                                    'error': None}) for rpath in listings)
+
+
+    def start(self):
+        """Start the refresh thread, once per process"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+
+    def _run(self):
+        """Refresh the listings forever, while this process holds the lock"""
+        while True:
+            if self._acquire():
+                self.refresh()
+            time.sleep(self.interval + random.uniform(0, self.jitter))
+
+
+    def _acquire(self):
+        """Tell if this process holds the lock of the host, taking it when free.
+        The lock is released by the exit of its process."""
+        if not self.lock_path or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+
+    def refresh(self):
+        """Crawl every listing and swap it in the cache, then sync the
+        namespace index so that the requests do not rebuild it"""
+        for rpath in self.listings:
+            start = time.time()
+            try:
+                if rpath == '/projects/all' and config.PROJECT_SYNC_INCREMENTAL:
+                    items = self.gitlab.sync_projects()
+                else:
+                    items = self.gitlab.crawl_listing(rpath)
+                    self.gitlab.store_listing(rpath, items)
+            except Exception as error:
+                with self._lock:
+                    self._stats[rpath]['error'] = str(error)
+                continue
+            if rpath == '/projects/all':
+                self.gitlab.index.sync_projects(items)
+            elif rpath == '/groups':
+                self.gitlab.index.sync_groups(items)
+            with self._lock:
+                self._stats[rpath].update({'last_refresh': time.time(),
+                                           'duration': round(time.time() - start, 3),
+                                           'items': len(items),
+                                           'error': None})
+
+
+    def stats(self):
+        """Return the last successful refresh time, duration, size and last error
+        of each listing
+
+        :return: dictionary of stats by listing
+        """
+        with self._lock:
+            result = dict((rpath, dict(stat)) for rpath, stat in self._stats.items())
+        return {'running': self._thread is not None and self._thread.is_alive(),
+                'leader': not self.lock_path or self._lock_file is not None,
+                'interval': self.interval,
+                'jitter': self.jitter,
+                'listings': result}
+
+
+WARMER = CacheWarmer(config.GITLAB_ADMIN_TOKEN,
+                     config.WARMER_LISTINGS,
+                     config.WARMER_INTERVAL,
+                     config.WARMER_JITTER,
+                     config.WARMER_LOCK_PATH)
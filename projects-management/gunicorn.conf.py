@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+'''
+Gunicorn settings of the production server, overridden by the environment:
+
+- GUNICORN_BIND: address to listen on (default 0.0.0.0:5000)
+- GUNICORN_WORKERS: number of worker processes (default 2 per CPU plus 1)
+- GUNICORN_THREADS: number of threads per worker (default 8), requests
+  waiting on GitLab for seconds, threads are the concurrency of a worker
+- GUNICORN_TIMEOUT: seconds before a silent worker is restarted (default 120)
+- GUNICORN_GRACEFUL_TIMEOUT: seconds given to the requests and background
+  jobs to finish on shutdown (default 60)
+
+The progress of the background jobs is polled from any worker: with several
+workers, JOBS_STORE must be a SQLite database rather than 'memory'.
+'''
+from __future__ import absolute_import
+
+import os
+import multiprocessing
+
+from gitlaber import config
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Refuse to start several workers with jobs kept in the memory of one"""
+    if workers > 1 and config.JOBS_ENABLED and config.JOBS_STORE == 'memory':
+        raise RuntimeError("JOBS_STORE 'memory' is only visible to the worker running "
+                           "a job, set it to a SQLite path to run {0} workers".format(workers))
+
+
+def worker_exit(server, worker):
+    """Let the background jobs of a stopping worker finish"""
+    from gitlaber.views import job_queue
+    if not job_queue.drain(graceful_timeout):
+        server.log.warning('Worker %s stopped with unfinished jobs', worker.pid)
@@ -10,53 +10,86 @@ from flask import Flask
 from flask.ext.assets import Environment, Bundle
 
 from gitlaber.views import view
+from gitlaber.warmer import WARMER
+from gitlaber.controllers import restore_snapshot
 from gitlaber import config
 
-application = Flask(__name__,\
-	                static_folder="gitlaber/static/",\
-	                template_folder="gitlaber/templates/",
-	                static_url_path="/static")
-application.secret_key = config.SECRET_KEY
+# Set Logger
+log = logging.getLogger("gitlaber")
 
-application.register_blueprint(view)
 
-# Scss
-assets = Environment(application)
-assets.versions = 'timestamp'
-assets.url_expire = True
-assets.manifest = 'file:c:\\manifest.to-be-deployed'  # explict filename
-assets.cache = False
-assets.auto_build = True
+def setup_logging():
+    """Log to the console and to gitlaber.log, once per process"""
+    if log.handlers:
+        return
+    console_formatter = logging.Formatter(
+                '%(filename)s:%(lineno)d\t\t\t%(message)s', '%m-%d %H:%M:%S')
+    file_formatter = logging.Formatter(
+                '%(levelname)s - %(asctime)s - %(process)s - %(pathname)s - %(lineno)d\n%(message)s', '%m-%d %H:%M:%S')
 
-assets.url = application.static_url_path
-scss = Bundle('scss/00_main.scss', filters='pyscss', output='css/main.css', depends=['scss/*.scss'])
-assets.register('scss_all', scss)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(console_formatter)
 
-assets.debug = False
-application.config['ASSETS_DEBUG'] = False
+    rotatingfile_handler = RotatingFileHandler('gitlaber.log', maxBytes=10000, backupCount=1)
+    rotatingfile_handler.setLevel(logging.DEBUG)
+    rotatingfile_handler.setFormatter(file_formatter)
 
-# Set Logger
-log = logging.getLogger("gitlaber")
-console_formatter = logging.Formatter(
-            '%(filename)s:%(lineno)d\t\t\t%(message)s', '%m-%d %H:%M:%S')
-file_formatter = logging.Formatter(
-            '%(levelname)s - %(asctime)s - %(process)s - %(pathname)s - %(lineno)d\n%(message)s', '%m-%d %H:%M:%S')
+    log.addHandler(console_handler)
+    log.setLevel(10)
+
+
+def create_app(production=False):
+    """Create the application
+
+    :param production: disable the debugger and the SCSS build, serving the
+    assets built by build_assets.py, and run the warmer in one process of the host
+    :return: the Flask application
+    """
+    application = Flask(__name__,\
+                          static_folder="gitlaber/static/",\
+                          template_folder="gitlaber/templates/",
+                          static_url_path="/static")
+    application.secret_key = config.SECRET_KEY
+    application.debug = not production
+
+    application.register_blueprint(view)
+
+    # Scss
+    assets = Environment(application)
+    assets.versions = 'timestamp'
+    assets.url_expire = True
+    assets.manifest = False
+    # In production the SCSS is compiled by build_assets.py, or the committed
+    # css/main.css is served
+    assets.auto_build = not production
+    assets.cache = False
+
+    assets.url = application.static_url_path
+    scss = Bundle('scss/00_main.scss', filters='pyscss', output='css/main.css', depends=['scss/*.scss'])
+    assets.register('scss_all', scss)
+
+    assets.debug = False
+    application.config['ASSETS_DEBUG'] = False
+    # The assets built by build_assets.py are only served in production, the
+    # development server always serves the sources and compiles the SCSS
+    application.config['BUILT_ASSETS'] = production
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(console_formatter)
+    setup_logging()
 
-rotatingfile_handler = RotatingFileHandler('gitlaber.log', maxBytes=10000, backupCount=1)
-rotatingfile_handler.setLevel(logging.DEBUG)
-rotatingfile_handler.setFormatter(file_formatter)
+    # Serve the GitLab listings stored by the previous processes
+    restore_snapshot()
 
-log.addHandler(console_handler)
-log.setLevel(10)
+    # Refresh the GitLab listings off the request path
+    if config.WARMER_ENABLED and config.GITLAB_ADMIN_TOKEN:
+        WARMER.start()
 
+    return application
 
 
 def run():
     # Start Application
+    application = create_app()
     application.run(host="0.0.0.0", port=5000, debug=True)
 
 if __name__ == '__main__':
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+Converge the environments of the users to a desired state file
+
+    python reconcile.py environments.json --dry-run
+    python reconcile.py environments.json --interval 600
+
+Reads the branches and members of the projects of the file once, then
+creates, updates and, with --prune, deletes only the branches and project
+memberships which differ, with the OAuth token of an admin user
+(GITLAB_ADMIN_TOKEN by default). See environments.example.json.
+'''
+from __future__ import absolute_import
+
+import sys
+import json
+import time
+import argparse
+
+from gitlaber import config
+from gitlaber.controllers import Gitlab
+from gitlaber.reconciler import Reconciler, load_desired_state
+
+
+def parse_args():
+    """Return the options of the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('path', help='desired state file')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the changes without writing them')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete the branches and memberships of the users on the '
+                             'projects of the file which have no row for them')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='seconds between two runs, 0 to run once')
+    parser.add_argument('--token', default=config.GITLAB_ADMIN_TOKEN,
+                        help='OAuth token of an admin user')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    options = parser.parse_args()
+    if not options.token:
+        parser.error('an admin token is required, with --token or GITLAB_ADMIN_TOKEN')
+    return options
+
+
+def report_lines(report):
+    """Yield the lines of a report"""
+    for username, operations in report.items():
+        for operation in operations:
+            for name, result in operation.items():
+                if name != "Error" and not isinstance(result, basestring):
+                    result = "Done"
+                yield u'{0}: {1}: {2}\n'.format(username, name, result)
+
+
+def main():
+    """Run the reconciler once, or every interval"""
+    options = parse_args()
+    gitlab = Gitlab({'access_token': (options.token, '')})
+    while True:
+        start = time.time()
+        reconciler = Reconciler(gitlab, load_desired_state(options.path), options.prune)
+        report = reconciler.run(options.dry_run)
+        if options.json:
+            sys.stdout.write(json.dumps(report, indent=4) + '\n')
+        else:
+            for line in report_lines(report):
+                sys.stdout.write(line.encode('utf-8'))
+            changes = sum(len(operations) for operations in report.values())
+            sys.stdout.write('{0} operations in {1:.1f}s\n'.format(changes, time.time() - start))
+        sys.stdout.flush()
+        if not options.interval:
+            return
+        time.sleep(options.interval)
+
+
+if __name__ == '__main__':
+    main()
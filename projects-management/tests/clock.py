@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+'''
+Fake clock of the tests
+'''
+
+from __future__ import absolute_import
+
+
+class FakeClock(object):
+    """Stand-in of the time module, moving only when slept or advanced"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = list()
+
+
+    def time(self):
+        """Return the current fake time"""
+        return self.now
+
+
+    def sleep(self, seconds):
+        """Record a sleep and advance the clock"""
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+    def advance(self, seconds):
+        """Advance the clock"""
+        self.now += seconds
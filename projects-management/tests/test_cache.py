@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the listing cache
+'''
+
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+from gitlaber import cache
+from gitlaber.cache import ListingCache
+from tests.clock import FakeClock
+
+
+class ListingCacheTest(unittest.TestCase):
+    """Expiry, eviction, stats and loads of the cached values"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = cache.time
+        cache.time = self.clock
+
+
+    def tearDown(self):
+        cache.time = self._time
+
+
+    def test_get_counts_hits_and_misses(self):
+        listings = ListingCache(ttl=10)
+        self.assertIsNone(listings.get('/users'))
+        listings.set('/users', ['a'])
+        self.assertEqual(listings.get('/users'), ['a'])
+        stats = listings.stats()['/users']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+    def test_expired_entry_is_served_stale_then_dropped(self):
+        listings = ListingCache(ttl=10, stale_ttl=5)
+        listings.set('/users', ['a'])
+        self.clock.advance(12)
+        self.assertEqual(listings.get('/users'), ['a'])
+        self.assertEqual(listings.stats()['/users']['stale_hits'], 1)
+        self.clock.advance(5)
+        self.assertIsNone(listings.get('/users'))
+        self.assertFalse(listings.contains('/users'))
+
+
+    def test_no_ttl_never_expires(self):
+        listings = ListingCache(ttl=None)
+        listings.set('/users', ['a'])
+        self.clock.advance(10 ** 6)
+        self.assertEqual(listings.get('/users'), ['a'])
+
+
+    def test_least_recently_used_entry_is_evicted(self):
+        listings = ListingCache(ttl=10, max_entries=2)
+        listings.set('/users', ['a'])
+        listings.set('/groups', ['b'])
+        listings.get('/users')
+        listings.set('/projects/all', ['c'])
+        self.assertTrue(listings.contains('/users'))
+        self.assertFalse(listings.contains('/groups'))
+        self.assertEqual(listings.stats()['/groups']['evictions'], 1)
+
+
+    def test_stats_key_aggregates_the_keys(self):
+        listings = ListingCache(ttl=10, stats_key='branches')
+        listings.set(1, ['master'])
+        listings.get(1)
+        listings.get(2)
+        stats = listings.stats()
+        self.assertEqual(list(stats), ['branches'])
+        self.assertEqual((stats['branches']['hits'], stats['branches']['misses'],
+                          stats['branches']['entries']), (1, 1, 1))
+
+
+    def test_update_keeps_the_creation_time(self):
+        listings = ListingCache(ttl=10)
+        listings.set('/users', ['a'])
+        self.clock.advance(6)
+        self.assertEqual(listings.update('/users', lambda items: items + ['b']), ['a', 'b'])
+        self.clock.advance(6)
+        self.assertFalse(listings.contains('/users'))
+        self.assertIsNone(listings.update('/groups', lambda items: items))
+
+
+    def test_invalidate_and_clear(self):
+        listings = ListingCache(ttl=10)
+        listings.set('/users', ['a'])
+        listings.set('/groups', ['b'])
+        listings.invalidate('/users')
+        self.assertFalse(listings.contains('/users'))
+        listings.clear()
+        self.assertFalse(listings.contains('/groups'))
+        self.assertEqual(listings.stats()['/groups']['invalidations'], 1)
+
+
+    def test_get_or_load_loads_once_for_concurrent_callers(self):
+        listings = ListingCache(ttl=10)
+        started = threading.Event()
+        release = threading.Event()
+        calls = list()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ['a']
+
+        results = list()
+        threads = [threading.Thread(target=lambda: results.append(
+            listings.get_or_load('/users', loader))) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['a']] * 5)
+
+
+    def test_get_or_load_serves_stale_value_while_reloading(self):
+        listings = ListingCache(ttl=10, stale_ttl=60)
+        listings.set('/users', ['old'])
+        self.clock.advance(11)
+        reloaded = threading.Event()
+
+        def loader():
+            reloaded.set()
+            return ['new']
+
+        self.assertEqual(listings.get_or_load('/users', loader), ['old'])
+        self.assertTrue(reloaded.wait(5))
+        for _ in range(100):
+            if listings.get('/users') == ['new']:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(listings.get('/users'), ['new'])
+
+
+    def test_iter_or_load_streams_then_stores(self):
+        listings = ListingCache(ttl=10)
+
+        def produce(emit):
+            emit('b')
+            emit('a')
+            return ['a', 'b']
+
+        streamed = list(listings.iter_or_load('/users', lambda: self.fail('loaded'), produce))
+        self.assertEqual(streamed, ['b', 'a'])
+        self.assertEqual(listings.get('/users'), ['a', 'b'])
+        self.assertEqual(list(listings.iter_or_load('/users', None, None)), ['a', 'b'])
+
+
+    def test_iter_or_load_callers_share_the_stream(self):
+        listings = ListingCache(ttl=10)
+        release = threading.Event()
+        calls = list()
+
+        def produce(emit):
+            calls.append(1)
+            emit('a')
+            release.wait(5)
+            emit('b')
+            return ['a', 'b']
+
+        first = listings.iter_or_load('/users', lambda: self.fail('loaded'), produce)
+        self.assertEqual(next(first), 'a')
+        second = listings.iter_or_load('/users', lambda: self.fail('loaded'), produce)
+        self.assertEqual(next(second), 'a')
+        release.set()
+        self.assertEqual(list(first), ['b'])
+        self.assertEqual(list(second), ['b'])
+        self.assertEqual(len(calls), 1)
+
+
+    def test_iter_or_load_slow_caller_does_not_hold_the_key(self):
+        listings = ListingCache(ttl=10)
+
+        def produce(emit):
+            emit('a')
+            emit('b')
+            return ['a', 'b']
+
+        first = listings.iter_or_load('/users', None, produce)
+        self.assertEqual(next(first), 'a')
+        # The load ended while the first caller was not reading
+        self.assertEqual(listings.get_or_load('/users', lambda: self.fail('loaded')), ['a', 'b'])
+        self.assertEqual(list(first), ['b'])
+
+
+    def test_iter_or_load_closed_caller_still_stores_the_value(self):
+        listings = ListingCache(ttl=10)
+        release = threading.Event()
+
+        def produce(emit):
+            emit('a')
+            release.wait(5)
+            return ['a', 'b']
+
+        first = listings.iter_or_load('/users', None, produce)
+        next(first)
+        first.close()
+        release.set()
+        self.assertEqual(listings.get_or_load('/users', lambda: self.fail('loaded')), ['a', 'b'])
+
+
+    def test_iter_or_load_error_is_raised_to_the_callers(self):
+        listings = ListingCache(ttl=10)
+
+        def produce(emit):
+            emit('a')
+            raise ValueError('down')
+
+        with self.assertRaises(ValueError):
+            list(listings.iter_or_load('/users', None, produce))
+        self.assertFalse(listings.contains('/users'))
+        self.assertEqual(listings.get_or_load('/users', lambda: ['loaded']), ['loaded'])
+
+
+if __name__ == '__main__':
+    unittest.main()
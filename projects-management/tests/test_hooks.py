@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the GitLab hooks parsing
+'''
+
+from __future__ import absolute_import
+
+import unittest
+
+from gitlaber.hooks import BLANK_COMMIT, branch_changes, destroyed_project
+
+COMMIT = 'a' * 40
+
+
+def push(ref, before=COMMIT, after=COMMIT, project_id=7):
+    """Return the body of a push hook"""
+    return {'object_kind': 'push', 'project_id': project_id, 'ref': ref,
+            'before': before, 'after': after}
+
+
+class BranchChangesTest(unittest.TestCase):
+    """Branches created and deleted by the push and system hooks"""
+
+    def test_push_creating_a_branch(self):
+        self.assertEqual(branch_changes(push('refs/heads/jdoe', before=BLANK_COMMIT)),
+                         (7, ['jdoe'], []))
+
+
+    def test_push_deleting_a_branch(self):
+        self.assertEqual(branch_changes(push('refs/heads/jdoe', after=BLANK_COMMIT)),
+                         (7, [], ['jdoe']))
+
+
+    def test_branch_name_with_slashes(self):
+        self.assertEqual(branch_changes(push('refs/heads/feature/x', before=BLANK_COMMIT)),
+                         (7, ['feature/x'], []))
+
+
+    def test_push_of_commits_changes_no_branch(self):
+        self.assertIsNone(branch_changes(push('refs/heads/master')))
+
+
+    def test_tag_push_is_ignored(self):
+        self.assertIsNone(branch_changes(push('refs/tags/v1', before=BLANK_COMMIT)))
+
+
+    def test_push_system_hook(self):
+        event = push('refs/heads/jdoe', before=BLANK_COMMIT, project_id='12')
+        del event['object_kind']
+        event['event_name'] = 'push'
+        self.assertEqual(branch_changes(event), (12, ['jdoe'], []))
+
+
+    def test_repository_update_with_several_changes(self):
+        event = {'event_name': 'repository_update', 'project_id': 7,
+                 'changes': [{'ref': 'refs/heads/a', 'before': BLANK_COMMIT, 'after': COMMIT},
+                             {'ref': 'refs/heads/b', 'before': COMMIT, 'after': BLANK_COMMIT},
+                             {'ref': 'refs/heads/c', 'before': COMMIT, 'after': COMMIT},
+                             {'ref': 'refs/tags/d', 'before': BLANK_COMMIT, 'after': COMMIT}]}
+        self.assertEqual(branch_changes(event), (7, ['a'], ['b']))
+
+
+    def test_other_hooks_and_missing_project(self):
+        self.assertIsNone(branch_changes({'object_kind': 'merge_request', 'project_id': 7}))
+        self.assertIsNone(branch_changes({}))
+        self.assertIsNone(branch_changes(push('refs/heads/jdoe', before=BLANK_COMMIT,
+                                              project_id=None)))
+
+
+class DestroyedProjectTest(unittest.TestCase):
+    """Projects deleted by the system hooks"""
+
+    def test_project_destroy(self):
+        self.assertEqual(destroyed_project({'event_name': 'project_destroy',
+                                            'project_id': '7'}), 7)
+
+
+    def test_other_hooks(self):
+        self.assertIsNone(destroyed_project({'event_name': 'project_create', 'project_id': 7}))
+        self.assertIsNone(destroyed_project({'event_name': 'project_destroy'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the namespace and prefix indexes
+'''
+
+from __future__ import absolute_import
+
+import unittest
+
+from gitlaber.index import NamespaceIndex, PrefixIndex
+
+
+def project(project_id, name, group):
+    """Return a project of a group"""
+    return {'id': project_id, 'name': name, 'path_with_namespace': '{0}/{1}'.format(group, name),
+            'namespace': {'id': 0, 'name': group}}
+
+
+class NamespaceIndexTest(unittest.TestCase):
+    """Lookups of the indexed listings, and their patching"""
+
+    def setUp(self):
+        self.projects = [project(1, 'alpha', 'puppet'), project(2, 'beta', 'puppet'),
+                         project(3, 'gamma', 'infra')]
+        self.groups = [{'id': 10, 'name': 'infra'}, {'id': 11, 'name': 'puppet'}]
+        self.index = NamespaceIndex()
+        self.index.sync_projects(self.projects)
+        self.index.sync_groups(self.groups)
+
+
+    def test_lookups(self):
+        self.assertEqual(self.index.project_with_namespace('puppet/beta')['id'], 2)
+        self.assertEqual(self.index.project_with_id(3)['name'], 'gamma')
+        self.assertEqual([x['id'] for x in self.index.projects_in_group('puppet')], [1, 2])
+        self.assertEqual(self.index.group_with_name('infra')['id'], 10)
+        self.assertIsNone(self.index.project_with_namespace('puppet/none'))
+        self.assertEqual(self.index.projects_in_group('none'), [])
+
+
+    def test_sync_rebuilds_only_for_another_listing(self):
+        self.index.projects_by_id.clear()
+        self.index.sync_projects(self.projects)
+        self.assertIsNone(self.index.project_with_id(1))
+        self.index.sync_projects(list(self.projects))
+        self.assertEqual(self.index.project_with_id(1)['name'], 'alpha')
+
+
+    def test_add_project_keeps_the_group_sorted(self):
+        added = project(4, 'aardvark', 'puppet')
+        patched = self.projects + [added]
+        self.index.add_project(added, self.projects, patched)
+        self.assertEqual([x['name'] for x in self.index.projects_in_group('puppet')],
+                         ['aardvark', 'alpha', 'beta'])
+        self.assertIs(self.index.project_with_namespace('puppet/aardvark'), added)
+        # The patched listing is now the indexed one
+        self.index.projects_by_id.clear()
+        self.index.sync_projects(patched)
+        self.assertIsNone(self.index.project_with_id(4))
+
+
+    def test_replace_project_moving_to_another_group(self):
+        moved = project(2, 'beta', 'infra')
+        patched = [x for x in self.projects if x['id'] != 2] + [moved]
+        self.index.add_project(moved, self.projects, patched)
+        self.assertIsNone(self.index.project_with_namespace('puppet/beta'))
+        self.assertEqual([x['name'] for x in self.index.projects_in_group('puppet')], ['alpha'])
+        self.assertEqual([x['name'] for x in self.index.projects_in_group('infra')],
+                         ['beta', 'gamma'])
+
+
+    def test_remove_project(self):
+        patched = self.projects[1:]
+        self.index.remove_project(1, self.projects, patched)
+        self.assertIsNone(self.index.project_with_id(1))
+        self.assertIsNone(self.index.project_with_namespace('puppet/alpha'))
+        self.assertEqual([x['id'] for x in self.index.projects_in_group('puppet')], [2])
+
+
+    def test_patch_of_another_listing_is_ignored(self):
+        self.index.add_project(project(4, 'delta', 'puppet'), list(self.projects), [])
+        self.index.remove_project(1, list(self.projects), [])
+        self.assertIsNone(self.index.project_with_id(4))
+        self.assertIsNotNone(self.index.project_with_id(1))
+
+
+    def test_add_and_remove_group(self):
+        renamed = {'id': 10, 'name': 'infrastructure'}
+        patched = [renamed, self.groups[1]]
+        self.index.add_group(renamed, self.groups, patched)
+        self.assertIsNone(self.index.group_with_name('infra'))
+        self.assertIs(self.index.group_with_name('infrastructure'), renamed)
+        self.index.remove_group(11, patched, [renamed])
+        self.assertIsNone(self.index.group_with_name('puppet'))
+
+
+class PrefixIndexTest(unittest.TestCase):
+    """Case insensitive prefix searches"""
+
+    def setUp(self):
+        self.users = [{'id': 1, 'username': 'jdoe', 'name': 'John Doe'},
+                      {'id': 2, 'username': 'jsmith', 'name': 'Jane Smith'},
+                      {'id': 3, 'username': 'admin', 'name': 'Administrator'},
+                      {'id': 4, 'username': 'doe', 'name': 'doe'}]
+        self.index = PrefixIndex(self.users, lambda user: (user['username'], user['name']))
+
+
+    def ids(self, result):
+        """Return the count and the ids of a search result"""
+        return result[0], [x['id'] for x in result[1]]
+
+
+    def test_case_insensitive_prefix(self):
+        self.assertEqual(self.ids(self.index.search('J')), (2, [2, 1]))
+        self.assertEqual(self.ids(self.index.search('jd')), (1, [1]))
+        self.assertEqual(self.ids(self.index.search('ADMIN')), (1, [3]))
+
+
+    def test_item_matching_several_strings_is_returned_once(self):
+        # Found by its username and its name, in the order of the first one
+        self.assertEqual(self.ids(self.index.search('doe')), (1, [4]))
+        self.assertEqual(self.ids(self.index.search('j')), (2, [2, 1]))
+
+
+    def test_no_match(self):
+        self.assertEqual(self.ids(self.index.search('zz')), (0, []))
+
+
+    def test_empty_prefix_pages_the_listing(self):
+        self.assertEqual(self.ids(self.index.search('', 1, 2)), (4, [2, 3]))
+
+
+    def test_offset_limit_and_where(self):
+        self.assertEqual(self.ids(self.index.search('j', 1, 1)), (2, [1]))
+        self.assertEqual(self.ids(self.index.search('', where=lambda x: x['id'] > 2)),
+                         (2, [3, 4]))
+        self.assertEqual(self.ids(self.index.search('j', where=lambda x: x['id'] == 2)),
+                         (1, [2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
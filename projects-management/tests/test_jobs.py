@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the job stores and queue
+'''
+
+from __future__ import absolute_import
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from gitlaber import jobs
+from gitlaber.jobs import JobQueue, MemoryJobStore, SQLiteJobStore
+from tests.clock import FakeClock
+
+
+class JobStoreTests(object):
+    """Tests of both stores, mixed in their test cases"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = jobs.time
+        jobs.time = self.clock
+        self.store = self.make_store(ttl=60)
+
+
+    def tearDown(self):
+        jobs.time = self._time
+
+
+    def test_job_states(self):
+        self.store.create('a', 'result')
+        job = self.store.get('a')
+        self.assertEqual((job['kind'], job['state'], job['result']), ('result', 'queued', None))
+        self.store.set_state('a', 'running')
+        self.store.set_state('a', 'done', result=[{'op': 'ok'}])
+        self.assertEqual(self.store.get('a')['result'], [{'op': 'ok'}])
+        self.store.create('b', 'bulk')
+        self.store.set_state('b', 'failed', error='down')
+        self.assertEqual(self.store.get('b')['error'], 'down')
+        self.assertIsNone(self.store.get('unknown'))
+
+
+    def test_operations_since_an_offset(self):
+        self.store.create('a', 'result')
+        self.store.add_operation('a', 'manage_project', {'create': 1})
+        self.store.add_operation('a', 'manage_user_env', {'fork': 2})
+        self.store.add_operation('a', 'manage_user_env', {'branch': 3})
+        operations = self.store.get('a')['operations']
+        self.assertEqual([x['operation'] for x in operations], ['create', 'fork', 'branch'])
+        self.assertEqual(operations[1], {'section': 'manage_user_env',
+                                         'operation': 'fork', 'response': 2})
+        self.assertEqual([x['operation'] for x in self.store.get('a', since=2)['operations']],
+                         ['branch'])
+        self.assertEqual(self.store.get('a', since=3)['operations'], [])
+
+
+    def test_expired_jobs_are_purged_on_create(self):
+        self.store.create('done', 'result')
+        self.store.add_operation('done', 'manage_project', {'create': 1})
+        self.store.set_state('done', 'done')
+        self.store.create('running', 'result')
+        self.store.set_state('running', 'running')
+        self.clock.advance(61)
+        self.assertIsNotNone(self.store.get('done'))
+        self.store.create('new', 'result')
+        self.assertIsNone(self.store.get('done'))
+        self.assertEqual(self.store.get('running')['state'], 'running')
+
+
+class MemoryJobStoreTest(JobStoreTests, unittest.TestCase):
+    """Jobs kept in memory"""
+
+    def make_store(self, ttl):
+        """Return the tested store"""
+        return MemoryJobStore(ttl)
+
+
+class SQLiteJobStoreTest(JobStoreTests, unittest.TestCase):
+    """Jobs kept in a SQLite database"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'jobs.db')
+        super(SQLiteJobStoreTest, self).setUp()
+
+
+    def tearDown(self):
+        super(SQLiteJobStoreTest, self).tearDown()
+        shutil.rmtree(self.folder)
+
+
+    def make_store(self, ttl):
+        """Return the tested store"""
+        return SQLiteJobStore(self.path, ttl)
+
+
+    def test_purged_job_operations_are_deleted(self):
+        self.store.create('done', 'result')
+        self.store.add_operation('done', 'manage_project', {'create': 1})
+        self.store.set_state('done', 'done')
+        self.clock.advance(61)
+        self.store.create('new', 'result')
+        connection = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM operations').fetchone(), (0,))
+        finally:
+            connection.close()
+
+
+    def test_kind_column_is_added_to_an_old_database(self):
+        os.remove(self.path)
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, state TEXT, '
+                               'created REAL, updated REAL, result TEXT, error TEXT)')
+            connection.execute("INSERT INTO jobs VALUES ('old', 'done', 0, 0, NULL, NULL)")
+        connection.close()
+        store = SQLiteJobStore(self.path)
+        self.assertIsNone(store.get('old')['kind'])
+        store.create('new', 'bulk')
+        self.assertEqual(store.get('new')['kind'], 'bulk')
+        # A second process opening the migrated database leaves it alone
+        self.assertEqual(SQLiteJobStore(self.path).get('new')['kind'], 'bulk')
+
+
+class JobQueueTest(unittest.TestCase):
+    """Jobs run by the worker threads"""
+
+    def setUp(self):
+        self.queue = JobQueue(MemoryJobStore(), workers=2)
+
+
+    def test_job_progress_and_result(self):
+        def function(progress):
+            progress('manage_project', {'create': 'ok'})
+            return ['done']
+
+        job_id = self.queue.submit(function, 'result')
+        self.assertTrue(self.queue.drain(5))
+        job = self.queue.get(job_id)
+        self.assertEqual((job['kind'], job['state'], job['result']), ('result', 'done', ['done']))
+        self.assertEqual([x['operation'] for x in job['operations']], ['create'])
+
+
+    def test_failed_job(self):
+        def function(progress):
+            raise ValueError('down')
+
+        job_id = self.queue.submit(function, 'bulk')
+        self.assertTrue(self.queue.drain(5))
+        self.assertEqual((self.queue.get(job_id)['state'], self.queue.get(job_id)['error']),
+                         ('failed', 'down'))
+
+
+    def test_drain_waits_for_the_running_jobs(self):
+        release = threading.Event()
+        job_id = self.queue.submit(lambda progress: release.wait(5), 'bulk')
+        self.assertFalse(self.queue.drain(0.05))
+        self.assertIn(self.queue.get(job_id)['state'], ('queued', 'running'))
+        release.set()
+        self.assertTrue(self.queue.drain(5))
+        self.assertEqual(self.queue.get(job_id)['state'], 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the rate limiter and the retry delays
+'''
+
+from __future__ import absolute_import
+
+import unittest
+
+from gitlaber import ratelimit
+from gitlaber.ratelimit import TokenBucket, backoff, retry_after
+from tests.clock import FakeClock
+
+
+class TokenBucketTest(unittest.TestCase):
+    """Bursts, steady rate and pauses"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = ratelimit.time
+        ratelimit.time = self.clock
+
+
+    def tearDown(self):
+        ratelimit.time = self._time
+
+
+    def test_burst_is_taken_without_waiting(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0] * 3)
+        self.assertEqual(self.clock.slept, [])
+
+
+    def test_calls_beyond_the_burst_wait_for_the_rate(self):
+        bucket = TokenBucket(rate=2, burst=1)
+        bucket.acquire()
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+
+
+    def test_tokens_come_back_up_to_the_burst(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        bucket.acquire()
+        bucket.acquire()
+        self.clock.advance(60)
+        self.assertEqual([bucket.acquire() for _ in range(2)], [0.0] * 2)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+
+
+    def test_no_rate_never_waits(self):
+        bucket = TokenBucket(rate=0, burst=0)
+        self.assertEqual([bucket.acquire() for _ in range(100)], [0.0] * 100)
+
+
+    def test_pause_holds_the_calls(self):
+        bucket = TokenBucket(rate=0, burst=1)
+        bucket.pause(5)
+        bucket.pause(2)
+        self.assertAlmostEqual(bucket.acquire(), 5.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+
+
+class RetryDelayTest(unittest.TestCase):
+    """Retry-After headers and jittered backoff"""
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after({'Retry-After': '3'}), 3.0)
+        self.assertEqual(retry_after({'Retry-After': '-1'}), 0)
+        self.assertIsNone(retry_after({}))
+        self.assertIsNone(retry_after(None))
+        self.assertIsNone(retry_after({'Retry-After': 'soon'}))
+
+
+    def test_retry_after_date_in_the_past(self):
+        self.assertEqual(retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}), 0)
+
+
+    def test_backoff_is_capped(self):
+        for attempt in range(1, 10):
+            delay = backoff(attempt, 0.5, 4)
+            self.assertTrue(0 <= delay <= min(4, 0.5 * 2 ** (attempt - 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
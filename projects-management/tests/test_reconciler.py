@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the reconciler, against the fake GitLab server of the benchmarks
+'''
+
+from __future__ import absolute_import
+
+import unittest
+
+from benchmarks.fake_gitlab import FakeGitlabState, start
+from gitlaber import config
+from gitlaber import controllers
+from gitlaber.batch import Batch
+from gitlaber.cache import ListingCache
+from gitlaber.controllers import Gitlab
+from gitlaber.index import NamespaceIndex
+from gitlaber.ratelimit import TokenBucket
+from gitlaber.reconciler import Reconciler
+
+
+def row(path, access='30', branch='master'):
+    """Return a row of the desired state of a user"""
+    group, name = path.split('/')
+    return {'group': group, 'name': name, 'access': access, 'branch': branch}
+
+
+class ReconcilerTest(unittest.TestCase):
+    """Changes planned from the current state of the fake server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start(FakeGitlabState(users=1, groups=1, projects=1))
+
+
+    @classmethod
+    def tearDownClass(cls):
+        # Close the kept-alive connections first, their handler threads die with
+        # the interpreter otherwise
+        controllers.TRANSPORT.session.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+    def setUp(self):
+        # project0 and project2 are in group0, project1 in group1
+        self.state = FakeGitlabState(users=5, groups=2, projects=3, branches=1)
+        self.server.RequestHandlerClass.state = self.state
+        self._url = config.GITLAB_URL
+        config.GITLAB_URL = self.server.url
+        self.gitlab = Gitlab({'access_token': ('tok', '')})
+        self.gitlab.limiter = TokenBucket(rate=0, burst=1)
+        self.gitlab.cache = ListingCache(ttl=None)
+        self.gitlab.branches = ListingCache(ttl=None)
+        self.gitlab.index = NamespaceIndex()
+        self.gitlab.snapshot = None
+
+
+    def tearDown(self):
+        config.GITLAB_URL = self._url
+
+
+    def member(self, user_id, access_level):
+        """Return a member of the fake server"""
+        return dict(self.state.user(user_id), access_level=access_level)
+
+
+    def plan(self, desired, prune=False):
+        """Return the (username, method, url) of the planned changes, and the errors"""
+        reconciler = Reconciler(self.gitlab, desired, prune, workers=2)
+        changes, errors = reconciler.plan(Batch(self.gitlab, 2, members_max_age=0))
+        return [(username, method, args[0]) for username, _, method, args in changes], errors
+
+
+    def test_missing_branch_and_member_are_created(self):
+        changes, errors = self.plan({'user2': [row('group0/project0')]})
+        self.assertEqual(changes, [('user2', 'post', '/projects/1/repository/branches'),
+                                   ('user2', 'post', '/projects/1/members')])
+        self.assertEqual(errors, {})
+
+
+    def test_existing_branch_is_left_alone(self):
+        self.state.branches[1].append('user2')
+        self.state.members[1].append(self.member(2, 30))
+        self.assertEqual(self.plan({'user2': [row('group0/project0')]}), ([], {}))
+
+
+    def test_member_with_another_access_level_is_updated(self):
+        self.state.branches[1].append('user2')
+        self.state.members[1].append(self.member(2, 20))
+        changes, _ = self.plan({'user2': [row('group0/project0', access='30')]})
+        self.assertEqual(changes, [('user2', 'put', '/projects/1/members/2')])
+
+
+    def test_user_in_the_group_gets_no_project_member(self):
+        self.state.branches[2].append('user2')
+        self.state.group_members[1001].append(self.member(2, 30))
+        self.assertEqual(self.plan({'user2': [row('group1/project1', access='40')]}), ([], {}))
+
+
+    def test_unknown_user_and_project_are_errors(self):
+        changes, errors = self.plan({'ghost': [row('group0/project0')],
+                                     'user2': [row('group0/nope')]})
+        self.assertEqual(changes, [])
+        self.assertEqual(errors, {'ghost': ['User ghost not found'],
+                                  'user2': ['Project group0/nope not found']})
+
+
+    def test_prune_deletes_the_projects_without_a_row(self):
+        self.state.branches[1].append('user2')
+        self.state.members[1].append(self.member(2, 30))
+        self.state.branches[3].append('user2')
+        self.state.members[3].append(self.member(2, 30))
+        desired = {'user2': [row('group0/project0')], 'user3': [row('group0/project2')]}
+        changes, _ = self.plan(desired, prune=True)
+        self.assertEqual([x for x in changes if x[1] == 'delete'],
+                         [('user2', 'delete', '/projects/3/repository/branches/user2'),
+                          ('user2', 'delete', '/projects/3/members/2')])
+        self.assertEqual(self.plan(desired)[0], [x for x in changes if x[1] != 'delete'])
+
+
+    def test_prune_keeps_the_projects_with_a_row(self):
+        self.state.branches[1].append('user2')
+        self.state.members[1].append(self.member(2, 30))
+        # Empty branch and access leave the branch and the member alone
+        changes, _ = self.plan({'user2': [row('group0/project0', access='', branch='')]},
+                               prune=True)
+        self.assertEqual(changes, [])
+
+
+    def test_dry_run_only_plans(self):
+        self.state.members[1].append(self.member(2, 20))
+        desired = {'user2': [row('group0/project0')], 'ghost': [row('group0/project0')]}
+        report = Reconciler(self.gitlab, desired, workers=2).run(dry_run=True)
+        self.assertEqual(report, {
+            'ghost': [{'Error': 'User ghost not found'}],
+            'user2': [{'create branch user2 in project project0': 'Planned'},
+                      {'update member user2 on project project0': 'Planned'}]})
+        self.assertEqual(self.state.branches[1], ['master'])
+        self.assertEqual(self.state.members[1], [self.member(2, 20)])
+
+
+    def test_run_converges(self):
+        self.state.members[1].append(self.member(2, 20))
+        desired = {'user2': [row('group0/project0')]}
+        Reconciler(self.gitlab, desired, workers=2).run()
+        self.assertEqual(self.state.branches[1], ['master', 'user2'])
+        self.assertEqual(self.state.members[1], [self.member(2, 30)])
+        self.assertEqual(self.plan(desired), ([], {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
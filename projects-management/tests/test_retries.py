@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of the retries of the GitLab requests
+'''
+
+from __future__ import absolute_import
+
+import unittest
+
+import requests
+
+from gitlaber import config
+from gitlaber import controllers
+from gitlaber.controllers import Gitlab
+from gitlaber.ratelimit import TokenBucket
+from tests.clock import FakeClock
+
+
+class FakeResponse(object):
+    """Response of the fake transport"""
+
+    def __init__(self, code, headers=None):
+        self.code = code
+        self.headers = headers or {}
+
+
+class FakeTransport(object):
+    """Stand-in of the pooled transport, answering with the given outcomes:
+    a status code, or an exception to raise"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = list()
+
+
+    def http_request(self, uri, headers=None, data=None, method=None):
+        """Record the request and return or raise the next outcome"""
+        self.sent.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome), '{}'
+
+
+class HttpRequestRetryTest(unittest.TestCase):
+    """Statuses and errors retried by method"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self._time = controllers.time
+        controllers.time = self.clock
+        self._retries = config.GITLAB_RETRIES
+        config.GITLAB_RETRIES = 3
+        self.gitlab = Gitlab({'access_token': ('tok', '')})
+        self.gitlab.limiter = TokenBucket(rate=0, burst=1)
+        self.gitlab.snapshot = None
+
+
+    def tearDown(self):
+        controllers.time = self._time
+        config.GITLAB_RETRIES = self._retries
+
+
+    def send(self, method, *outcomes):
+        """Send a request through a fake transport, return the sent methods
+        and the status of the response"""
+        self.gitlab.transport = FakeTransport(*outcomes)
+        data = {'name': 'a'} if method == 'POST' else None
+        response, _ = self.gitlab.http_request('http://gitlab/api/v3/projects', {}, data, method)
+        return self.gitlab.transport.sent, response.code
+
+
+    def test_get_503_is_retried(self):
+        self.assertEqual(self.send('GET', 503, 503, 200), (['GET'] * 3, 200))
+        self.assertEqual(len(self.clock.slept), 2)
+
+
+    def test_get_gives_up_after_the_retries(self):
+        self.assertEqual(self.send('GET', 502, 502, 502, 502), (['GET'] * 4, 502))
+
+
+    def test_post_5xx_is_not_retried(self):
+        for code in (500, 502, 503, 504):
+            self.assertEqual(self.send('POST', code, 201), (['POST'], code))
+        self.assertEqual(self.clock.slept, [])
+
+
+    def test_post_429_is_retried(self):
+        self.assertEqual(self.send('POST', 429, 201), (['POST'] * 2, 201))
+
+
+    def test_post_connect_timeout_is_retried(self):
+        self.assertEqual(self.send('POST', requests.exceptions.ConnectTimeout(), 201),
+                         (['POST'] * 2, 201))
+
+
+    def test_post_connection_error_is_not_retried(self):
+        for error in (requests.exceptions.ConnectionError(), requests.exceptions.ReadTimeout()):
+            with self.assertRaises(type(error)):
+                self.send('POST', error, 201)
+            self.assertEqual(self.gitlab.transport.sent, ['POST'])
+        self.assertEqual(self.clock.slept, [])
+
+
+    def test_get_connection_error_is_retried(self):
+        self.assertEqual(self.send('GET', requests.exceptions.ConnectionError(), 200),
+                         (['GET'] * 2, 200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+'''
+WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+'''
+from __future__ import absolute_import
+
+from main import create_app
+
+application = create_app(production=True)